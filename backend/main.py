@@ -1,30 +1,73 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import json
+import hmac
+import secrets
 import uuid
 import logging
 import sys
 import os
+import time
+import random
 import asyncio
 
 
 # Добавляем путь для импортов
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from utils.connection_manager import ConnectionManager
+from utils.connection_manager import ConnectionManager, SERVICE_RESTART_CODE
+from utils import messages
+from utils.traffic_recorder import TrafficRecorder
+from utils.config import ServerConfig, current_worker, load_env_file, worker_path
+from utils.latency import LatencyTracker, is_finite_number, is_plausible_timestamp
+from utils.batching import ChatBatcher
+from utils.handshake import HandshakeError, POLICY_VIOLATION_CODE, parse_handshake
+
+# Конфигурация из переменных окружения и .env (см. .env.example)
+load_env_file()
+config = ServerConfig.from_env()
 
 # Настройка логирования
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=logging.DEBUG if config.debug else logging.INFO)
 logger = logging.getLogger(__name__)
 
-CONNECTION_TIMEOUT = 60
+drain_task: Optional[asyncio.Task] = None
+
+
+async def drain_server():
+    """Отправляем накопленные пачки и закрываем соединения с подсказкой о переподключении"""
+    if batcher is not None:
+        # Пока идет дренаж, сообщения больше не копятся: сокеты закрываются пачками
+        await batcher.close()
+    await manager.drain_connections(config.drain_batch_size, config.drain_batch_interval, config.reconnect_jitter)
+
+
+def ensure_drain() -> asyncio.Task:
+    """Запускаем дренаж один раз (из /admin/drain, DrainingServer или lifespan), повторные вызовы ждут ту же задачу"""
+    global drain_task
+    if drain_task is None:
+        drain_task = asyncio.create_task(drain_server())
+    return drain_task
+
+
+async def drain_before_shutdown():
+    """Хук для DrainingServer: дренируем до того, как uvicorn закроет сокеты"""
+    await ensure_drain()
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     # Startup
+    global recorder
     logging.info("Starting Bridge server...")
+    # lifespan выполняется в каждом воркере уже после fork: файлы и поток записи - свои у процесса
+    worker = current_worker()
+    manager.worker = worker
+    manager.load_snapshot()
+    if config.capture_path:
+        capture_path = config.capture_path if worker is None else worker_path(config.capture_path, worker)
+        recorder = TrafficRecorder(capture_path)
     cleanup_task = asyncio.create_task(periodic_cleanup())
     yield
     # Shutdown
@@ -35,6 +78,15 @@ async def lifespan(_: FastAPI):
     except asyncio.CancelledError:
         pass
 
+    # Обычно дренаж уже выполнен в DrainingServer.shutdown; здесь - запасной путь
+    # для запуска без serve() (например, uvicorn main:app)
+    if drain_task is not None or manager.active_connections:
+        await ensure_drain()
+
+    if recorder is not None:
+        await asyncio.to_thread(recorder.close)
+        recorder = None
+
 app = FastAPI(
     title="Bridge API",
     description="Backend for Bridge App",
@@ -51,32 +103,189 @@ app.add_middleware(
 )
 
 
-manager = ConnectionManager()
+manager = ConnectionManager(snapshot_path=config.snapshot_path, inactivity_timeout=config.inactivity_timeout)
+recorder: Optional[TrafficRecorder] = None  # Создается в lifespan, если задан BRIDGE_CAPTURE_PATH
+latency = LatencyTracker()
+# Склейка быстрых сообщений включается CHAT_BATCH_DELAY и только для клиентов с "batching": true
+batcher = (
+    ChatBatcher(manager.send_personal_message, config.chat_batch_delay, config.chat_batch_max_messages)
+    if config.chat_batch_delay > 0 else None
+)
+
+
+async def flush_before_cleanup(user_ids: List[str], partner_ids: List[str]):
+    """Отключаемым по неактивности склейка больше не нужна, а партнерам досылаем ее
+    до partner_disconnected - как при обычном отключении в websocket_endpoint"""
+    if batcher is None:
+        return
+    for user_id in user_ids:
+        batcher.forget(user_id)
+    for partner_id in partner_ids:
+        await batcher.flush(partner_id)
 
 
 async def periodic_cleanup():
     """Периодическая очистка неактивных соединений"""
     while True:
-        await asyncio.sleep(60)  # Проверяем каждую минуту
+        await asyncio.sleep(config.cleanup_interval)
         try:
-            await manager.cleanup_inactive_connections()
+            await manager.cleanup_inactive_connections(before_notify=flush_before_cleanup)
             logging.info(f"Cleanup completed. Active: {len(manager.active_connections)}, Waiting: {manager.get_waiting_queue_size()}")
         except Exception as e:
             logging.error(f"Cleanup error: {e}")
 
+async def forward_chat_message(user_id: str, message_data: Dict[str, Any],
+                               received_at: float, received_perf: float) -> bool:
+    """Пересылаем сообщение партнеру; если клиент прислал seq - добавляем метки времени"""
+    partner_id = manager.get_partner_id(user_id)
+    partner = manager.get_session(partner_id) if partner_id else None
+    if partner is None:
+        return False
+
+    text = message_data.get("text", "")
+    seq = message_data.get("seq")
+    client_ts = message_data.get("client_ts")
+    # Метки с NaN/Infinity или с нереальным временем не учитываем и не пересылаем партнеру
+    traced = is_finite_number(seq) and is_plausible_timestamp(client_ts, received_at)
+    if traced:
+        latency.record(LatencyTracker.CLIENT_TO_SERVER, received_at - client_ts)
+
+        def chat_message() -> str:
+            # Вызывается в момент отправки: время в пачке входит в server_queue, а не в server_to_client
+            latency.record(LatencyTracker.SERVER_QUEUE, time.perf_counter() - received_perf)
+            return messages.traced_chat_message(text, user_id, seq, client_ts, received_at, time.time())
+    else:
+        chat_message = messages.chat_message(text, user_id)
+
+    if batcher is not None and partner.batching:
+        await batcher.submit(chat_message, partner_id)
+    else:
+        await manager.send_personal_message(chat_message() if traced else chat_message, partner_id)
+    return True
+
+
+async def forward_chat_ack(user_id: str, message_data: Dict[str, Any]):
+    """Получатель подтвердил сообщение - учитываем задержки и передаем ack отправителю"""
+    seq = message_data.get("seq")
+    server_recv_ts = message_data.get("server_recv_ts")
+    server_send_ts = message_data.get("server_send_ts")
+    client_recv_ts = message_data.get("client_recv_ts")
+    now = time.time()
+    # server_*_ts клиент только возвращает, но проверить их все равно нужно: иначе
+    # любой клиент заполнит гистограммы выдуманными значениями
+    if not is_finite_number(seq) or not all(
+            is_plausible_timestamp(value, now) for value in (server_recv_ts, server_send_ts, client_recv_ts)):
+        return
+    if not server_recv_ts <= server_send_ts <= now:
+        return
+
+    latency.record(LatencyTracker.SERVER_TO_CLIENT, client_recv_ts - server_send_ts)
+    latency.record(LatencyTracker.DELIVERY_ROUNDTRIP, now - server_send_ts)
+
+    partner_id = manager.get_partner_id(user_id)
+    if partner_id and partner_id in manager.active_connections:
+        await manager.send_personal_message(
+            messages.chat_ack(seq, server_recv_ts, server_send_ts, client_recv_ts),
+            partner_id
+        )
+
+
+async def notify_match(user_data: Dict[str, Any], partner: Dict[str, Any]):
+    """Сообщаем обоим пользователям о найденной паре (каждому - о его ПАРТНЕРЕ)"""
+    user_id = user_data['user_id']
+    logger.info(
+        f"🟢 MATCH: {user_id} ({user_data.get('country')}) <-> {partner['user_id']} ({partner.get('country')})")
+
+    await manager.send_personal_message(
+        messages.match_found(
+            partner.get('country', 'Unknown'),
+            partner.get('language') or 'Unknown',
+            user_data.get('country', 'Unknown')
+        ),
+        user_id
+    )
+    await manager.send_personal_message(
+        messages.match_found(
+            user_data.get('country', 'Unknown'),
+            user_data.get('language') or 'Unknown',
+            partner.get('country', 'Unknown')
+        ),
+        partner['user_id']
+    )
+
+
+async def match_after_resume_grace(user_data: Dict[str, Any]):
+    """Прежний партнер не вернулся за RESUME_GRACE - подбираем пару как обычно"""
+    await asyncio.sleep(manager.resume_grace)
+    if not manager.is_waiting(user_data['user_id']):
+        return
+    user_data = {key: value for key, value in user_data.items() if key != 'previous_partner_id'}
+    partner = await manager.find_partner(user_data)
+    if partner:
+        await notify_match(user_data, partner)
+
+
+async def reject_while_draining(websocket):
+    """Во время дренажа новых пользователей не принимаем - отправляем на другой узел"""
+    # Случайная задержка, как в drain_connections: отказанные не вернутся все разом
+    reconnect_after = round(random.uniform(0, config.reconnect_jitter), 2)
+    await websocket.send_text(messages.server_draining(reconnect_after))
+    await websocket.close(code=SERVICE_RESTART_CODE)
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     # Принимаем соединение
     await websocket.accept()
+    if recorder is not None:
+        websocket = recorder.wrap(websocket)
+
+    if manager.draining:
+        await reject_while_draining(websocket)
+        return
+
+    # Ждем первоначальные данные от пользователя и проверяем их до того, как заводить сессию
+    try:
+        data = await asyncio.wait_for(websocket.receive_text(), timeout=config.connection_timeout)
+        user_data = parse_handshake(data)
+    except HandshakeError as e:
+        logger.info(f"🔴 REJECTED HANDSHAKE: {e}")
+        await websocket.send_text(messages.error(str(e)))
+        await websocket.close(code=POLICY_VIOLATION_CODE)
+        return
+    except asyncio.TimeoutError:
+        logger.info("🔴 NO HANDSHAKE RECEIVED, CLOSING")
+        await websocket.close(code=POLICY_VIOLATION_CODE)
+        return
+    except WebSocketDisconnect:
+        return
+
+    # Дренаж мог начаться, пока ждали первый кадр (например, у заранее открытого сокета);
+    # drain_connections такого клиента уже не увидит
+    if manager.draining:
+        await reject_while_draining(websocket)
+        return
 
     user_id = str(uuid.uuid4())
     logger.info(f"🔵 NEW WEBSOCKET CONNECTION: {user_id}")
+    rematch_task: Optional[asyncio.Task] = None
 
     try:
-        # Ждем первоначальные данные от пользователя
-        data = await websocket.receive_text()
-        user_data = json.loads(data)
+        # Клиент переподключается после перезапуска сервера - восстанавливаем сессию
+        resume_token = user_data.pop("resume_token", None)
+        saved_session = manager.restore_session(resume_token) if resume_token else None
+        if saved_session and saved_session["user_id"] not in manager.active_connections:
+            user_id = saved_session["user_id"]
+            batching = user_data["batching"]
+            user_data = saved_session["user_data"]
+            user_data["batching"] = batching
+            if saved_session.get("partner_id"):
+                user_data["previous_partner_id"] = saved_session["partner_id"]
+            logger.info(f"🔵 CLIENT {user_id} RESUMED SESSION")
         user_data["user_id"] = user_id
+        # Токен восстановления знает только сам клиент; при каждом подключении выдаем новый
+        resume_token = secrets.token_urlsafe(24)
+        user_data["resume_token"] = resume_token
 
         logger.info(f"🔵 CLIENT {user_id} FROM {user_data.get('country')} CONNECTED")
 
@@ -84,212 +293,61 @@ async def websocket_endpoint(websocket: WebSocket):
         await manager.connect(websocket, user_id, user_data)
 
         # Отправляем подтверждение подключения
-        await manager.send_personal_message(
-            json.dumps({
-                "type": "connection_established",
-                "user_id": user_id,
-                "message": "Successfully connected to Bridge server"
-            }),
-            user_id
-        )
+        await manager.send_personal_message(messages.connection_established(user_id, config.heartbeat_interval, resume_token), user_id)
         logger.info(f"🔵 CLIENT {user_id} SENT connection_established")
 
-        # Пытаемся найти пару
+        # Пытаемся найти пару (find_partner сразу связывает обоих пользователей)
         partner = await manager.find_partner(user_data)
 
         if partner:
-            logger.info(
-                f"🟢 MATCH: {user_id} ({user_data.get('country')}) <-> {partner['user_id']} ({partner.get('country')})")
-
-            # Сохраняем информацию о паре в объектах пользователей
-            if user_id in manager.active_connections:
-                manager.active_connections[user_id]["partner_id"] = partner['user_id']
-            if partner['user_id'] in manager.active_connections:
-                manager.active_connections[partner['user_id']]["partner_id"] = user_id
-
-            # ПЕРЕВОДИМ ПЕРВОГО КЛИЕНТА В РЕЖИМ ЧАТА
-            await manager.move_to_chat_mode(partner['user_id'], user_id)
-
-            # Уведомляем каждого пользователя о ПАРТНЕРЕ (разные сообщения!)
-            # ОТПРАВЛЯЕМ ПЕРВОМУ ПОЛЬЗОВАТЕЛЮ
-            logger.info(f"📤 SENDING match_found to {user_id}")
-            await manager.send_personal_message(
-                json.dumps({
-                    "type": "match_found",
-                    "message": "Partner found! Ready to start conversation.",
-                    "partner_country": partner.get('country', 'Unknown'),
-                    "partner_language": partner.get('language', 'Unknown'),
-                    "your_country": user_data.get('country', 'Unknown')
-                }),
-                user_id
-            )
-
-            # ОТПРАВЛЯЕМ ВТОРОМУ ПОЛЬЗОВАТЕЛЮ
-            logger.info(f"📤 SENDING match_found to {partner['user_id']}")
-            await manager.send_personal_message(
-                json.dumps({
-                    "type": "match_found",
-                    "message": "Partner found! Ready to start conversation.",
-                    "partner_country": user_data.get('country', 'Unknown'),
-                    "partner_language": user_data.get('language', 'Unknown'),
-                    "your_country": partner.get('country', 'Unknown')
-                }),
-                partner['user_id']
-            )
-
-            logger.info(f"🎯 BOTH USERS MOVED TO CHAT MODE")
-            logger.info(f"🎯 STARTING CHAT SESSIONS")
-            logger.info(f"🎯 {user_id} partner_id: {manager.active_connections[user_id].get('partner_id')}")
-            logger.info(
-                f"🎯 {partner['user_id']} partner_id: {manager.active_connections[partner['user_id']].get('partner_id')}")
-
-            # Проверим, оба ли пользователя перешли в режим чата
-            if manager.active_connections[user_id].get("partner_id") != partner['user_id']:
-                logger.error(
-                    f"❌ USER {user_id} HAS WRONG PARTNER_ID: {manager.active_connections[user_id].get('partner_id')}")
-            if manager.active_connections[partner['user_id']].get("partner_id") != user_id:
-                logger.error(
-                    f"❌ PARTNER {partner['user_id']} HAS WRONG PARTNER_ID: {manager.active_connections[partner['user_id']].get('partner_id')}")
-
-            logger.info(f"🟢 ENTERING CHAT LOOP for {user_id}")
-
-            # ОСНОВНОЙ ЦИКЛ ОБРАБОТКИ СООБЩЕНИЙ ДЛЯ ЭТОЙ ПАРЫ
-            try:
-                logger.info(f"🟢 USER {user_id} ENTERED MAIN CHAT LOOP")
-
-                while True:
-                    data = await websocket.receive_text()
-                    message_data = json.loads(data)
-                    logger.info(f"📨 MESSAGE FROM {user_id}: {message_data}")
-
-                    if message_data.get("type") == "chat_message":
-                        partner_id = manager.active_connections[user_id].get("partner_id")
-                        logger.info(f"🔍 Looking for partner {partner_id} for user {user_id}")
-
-                        if partner_id and partner_id in manager.active_connections:
-                            chat_message = json.dumps({
-                                "type": "chat_message",
-                                "text": message_data.get("text", ""),
-                                "from_user": user_id
-                            })
-                            logger.info(f"📤 FORWARDING from {user_id} to {partner_id}: {message_data.get('text')}")
-                            await manager.send_personal_message(chat_message, partner_id)
-                            logger.info(f"✅ MESSAGE FORWARDED SUCCESSFULLY")
-
-                    # Обрабатываем heartbeat
-                    elif message_data.get("type") == "heartbeat":
-                        manager.update_activity(user_id)
-                        logger.debug(f"💓 Heartbeat from {user_id}")
-
-            except WebSocketDisconnect:
-                logger.info(f"🔴 USER {user_id} DISCONNECTED FROM CHAT - WebSocketDisconnect")
-                # Уведомляем партнера об отключении
-                partner_id = manager.active_connections[user_id].get("partner_id")
-                if partner_id and partner_id in manager.active_connections:
-                    await manager.send_personal_message(
-                        json.dumps({
-                            "type": "partner_disconnected",
-                            "message": "Your conversation partner has disconnected"
-                        }),
-                        partner_id
-                    )
-                    # Очищаем partner_id у партнера
-                    manager.active_connections[partner_id]["partner_id"] = None
-                raise  # Повторно вызываем исключение для обработки во внешнем блоке
-
-            except Exception as e:
-                logger.error(f"🔴 USER {user_id} CRITICAL ERROR IN CHAT LOOP: {e}")
-
+            await notify_match(user_data, partner)
         else:
-            # Код для пользователя в очереди ожидания
             logger.info(f"🟡 {user_id} ADDED TO WAITING QUEUE")
-            await manager.send_personal_message(
-                json.dumps({
-                    "type": "waiting",
-                    "message": "Looking for a conversation partner...",
-                    "queue_position": manager.get_waiting_queue_size()
-                }),
-                user_id
-            )
-
-            # Цикл ожидания
-            try:
-                chat_mode_activated = False
-                while not chat_mode_activated:
-                    # Проверяем, не нашли ли нам пару
-                    if user_id in manager.active_connections and manager.active_connections[user_id].get("partner_id"):
-                        logger.info(f"🟢 USER {user_id} TRANSITIONING FROM WAITING TO CHAT")
-                        chat_mode_activated = True
-                        break
-
-                    # Ждем сообщения с таймаутом
-                    try:
-                        data = await asyncio.wait_for(websocket.receive_text(), timeout=1.0)
-                        message_data = json.loads(data)
-                        logger.info(f"⏳ WAITING USER {user_id} SENT: {message_data}")
-
-                        if message_data.get("type") == "chat_message":
-                            logger.info(f"❌ WAITING USER {user_id} TRIED TO SEND MESSAGE")
-                            await manager.send_personal_message(
-                                json.dumps({
-                                    "type": "error",
-                                    "message": "You are still waiting for a partner"
-                                }),
-                                user_id
-                            )
-
-                        elif message_data.get("type") == "heartbeat":
-                            manager.update_activity(user_id)
-                            logger.debug(f"💓 Heartbeat from WAITING user {user_id}")
-
-                    except asyncio.TimeoutError:
-                        # Таймаут - проверяем состояние снова
-                        continue
-
-                # ЕСЛИ ВЫШЛИ ИЗ ЦИКЛА ОЖИДАНИЯ - ПЕРЕХОДИМ В РЕЖИМ ЧАТА
-                if chat_mode_activated:
-                    logger.info(f"🟢 USER {user_id} ENTERING CHAT MODE AFTER WAITING")
-
-                    while True:
-                        data = await websocket.receive_text()
-                        message_data = json.loads(data)
-                        logger.info(f"📨 MESSAGE FROM {user_id} (FROM WAITING): {message_data}")
-
-                        if message_data.get("type") == "chat_message":
-                            partner_id = manager.active_connections[user_id].get("partner_id")
-                            if partner_id and partner_id in manager.active_connections:
-                                chat_message = json.dumps({
-                                    "type": "chat_message",
-                                    "text": message_data.get("text", ""),
-                                    "from_user": user_id
-                                })
-                                await manager.send_personal_message(chat_message, partner_id)
-
-                        elif message_data.get("type") == "heartbeat":
-                            manager.update_activity(user_id)
-                            logger.debug(f"💓 Heartbeat from CHAT user {user_id}")
-
-            except WebSocketDisconnect:
-                logger.info(f"🔴 {user_id} DISCONNECTED FROM WAITING")
-
+            await manager.send_personal_message(messages.waiting(manager.get_waiting_queue_size()), user_id)
+            if user_data.get("previous_partner_id"):
+                # Менеджер придерживает пользователя для прежнего партнера, но не дольше RESUME_GRACE
+                rematch_task = asyncio.create_task(match_after_resume_grace(user_data))
+
+        # Один цикл приема и для ожидания, и для чата: ожидающий пользователь "припаркован"
+        # в receive_text без таймеров, а о найденной паре ему сообщает тот, кто его нашел.
+        # Режим (ожидание или чат) каждый раз берется из состояния менеджера.
+        while True:
+            data = await websocket.receive_text()
+            received_at, received_perf = time.time(), time.perf_counter()
+            message_data = json.loads(data)
+            message_type = message_data.get("type")
+            logger.debug("📨 MESSAGE FROM %s: %s", user_id, message_type)
+
+            if message_type == "chat_message":
+                if (not await forward_chat_message(user_id, message_data, received_at, received_perf)
+                        and manager.is_waiting(user_id)):
+                    await manager.send_personal_message(messages.STILL_WAITING_ERROR, user_id)
+
+            elif message_type == "chat_ack":
+                await forward_chat_ack(user_id, message_data)
+
+            elif message_type == "heartbeat":
+                manager.update_activity(user_id)
 
     except WebSocketDisconnect:
         logger.info(f"User {user_id} disconnected")
-        # Уведомляем партнера если он есть
-        if user_id in manager.active_connections:
-            partner_id = manager.active_connections[user_id].get("partner_id")
-            if partner_id and partner_id in manager.active_connections:
-                await manager.send_personal_message(
-                    json.dumps({
-                        "type": "partner_disconnected",
-                        "message": "Your conversation partner has disconnected"
-                    }),
-                    partner_id
-                )
-        manager.disconnect(user_id)
     except Exception as e:
         logger.error(f"Error with user {user_id}: {str(e)}")
-        manager.disconnect(user_id)
+
+    if rematch_task is not None:
+        rematch_task.cancel()
+
+    # Уведомляем партнера если он есть; пара разрывается с обеих сторон,
+    # поэтому партнер не получит уведомление дважды
+    partner_id = manager.unpair(user_id) if not manager.draining else None
+    if batcher is not None:
+        batcher.forget(user_id)
+        if partner_id:
+            # Последние сообщения должны прийти раньше уведомления об отключении
+            await batcher.flush(partner_id)
+    if partner_id:
+        await manager.broadcast(messages.PARTNER_DISCONNECTED, [partner_id])
+    manager.disconnect(user_id)
 
 
 @app.get("/")
@@ -310,8 +368,8 @@ async def health_check():
 async def get_stats():
     """Получаем статистику сервера"""
     active_pairs = 0
-    for user_data in manager.active_connections.values():
-        if user_data.get("partner_id"):
+    for session in manager.active_connections.values():
+        if session.partner_id:
             active_pairs += 1
     active_pairs = active_pairs // 2  # Каждая пара учитывается дважды
 
@@ -322,6 +380,30 @@ async def get_stats():
     }
 
 
+@app.get("/stats/latency")
+async def get_latency_stats():
+    """Гистограммы задержек chat_message по участкам пути"""
+    return latency.snapshot()
+
+
+@app.post("/admin/drain")
+async def start_drain(x_admin_token: Optional[str] = Header(default=None)):
+    """Запускаем плавный дренаж перед перезапуском процесса"""
+    # Дренаж необратим: без настоящего SECRET_KEY эндпоинт выключен
+    admin_token = config.admin_token
+    if admin_token is None:
+        raise HTTPException(status_code=403, detail="Admin API is disabled: SECRET_KEY is not set")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+    task = ensure_drain()
+    return {
+        "status": "draining",
+        "active_connections": len(manager.active_connections),
+        "done": task.done()
+    }
+
+
 @app.get("/debug/state")
 async def debug_state():
     """Подробная отладочная информация"""
@@ -332,17 +414,18 @@ async def debug_state():
     }
 
     # Информация о активных соединениях
-    for user_id, data in manager.active_connections.items():
-        partner_id = data.get("partner_id")
+    for user_id, session in manager.active_connections.items():
+        partner_id = session.partner_id
         partner_info = "None"
-        if partner_id and partner_id in manager.active_connections:
-            partner_info = f"{partner_id} ({manager.active_connections[partner_id]['user_data'].get('country')})"
+        partner = manager.get_session(partner_id) if partner_id else None
+        if partner is not None:
+            partner_info = f"{partner_id} ({partner.country})"
 
         state["active_connections"][user_id] = {
-            "country": data["user_data"].get("country"),
+            "country": session.country,
             "partner_id": partner_id,
             "partner_info": partner_info,
-            "in_waiting": any(u.get('user_id') == user_id for u in manager.waiting_users)
+            "in_waiting": manager.is_waiting(user_id)
         }
 
         # Проверяем проблемы
@@ -358,6 +441,6 @@ async def debug_state():
     return state
 
 if __name__ == "__main__":
-    import uvicorn
+    from utils.server import serve
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    serve(app, config, before_shutdown=drain_before_shutdown)
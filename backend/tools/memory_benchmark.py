@@ -0,0 +1,147 @@
+"""Замер памяти на соединение при большом числе ожидающих и простаивающих пользователей.
+
+Подключает N смоделированных сокетов к ConnectionManager (часть пользователей
+ждет пару, остальные уже в парах и молчат) и через tracemalloc считает,
+сколько байт Python-объектов приходится на одно соединение. Это только состояние
+ConnectionManager: настоящие сокеты заменены пустыми заглушками.
+
+Пример:
+    python -m backend.tools.memory_benchmark
+    python -m backend.tools.memory_benchmark --sizes 10000 100000 --parked
+
+С --parked на каждое соединение дополнительно создается корутина, "припаркованная"
+в ожидании кадра, как websocket_endpoint в receive_text. Память самого сервера
+(uvicorn, websockets, буферы ядра) в замер не входит.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import sys
+import os
+import tracemalloc
+import uuid
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.utils.connection_manager import ConnectionManager
+from backend.tools.simulator import _run
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+
+class _IdleWebSocket:
+    """Минимальная заглушка сокета: одна на соединение, как в реальном сервере"""
+
+    __slots__ = ()
+
+    async def send_text(self, message):
+        pass
+
+
+@dataclass
+class MemoryResult:
+    connections: int
+    waiting: int
+    paired: int
+    parked: bool
+    total_bytes: int
+
+    @property
+    def bytes_per_connection(self) -> float:
+        return self.total_bytes / self.connections if self.connections else 0.0
+
+    def format(self) -> str:
+        # Сокеты, буферы и сам сервер не входят в замер ни в одном режиме
+        mode = "manager state + parked coroutines only" if self.parked else "manager state only"
+        return (f"{self.connections:>10,} connections ({self.waiting:,} waiting, {self.paired:,} paired, {mode}): "
+                f"{self.total_bytes / 2 ** 20:9.1f} MiB, {self.bytes_per_connection:7.1f} bytes/connection")
+
+    def to_dict(self):
+        result = asdict(self)
+        result["bytes_per_connection"] = round(self.bytes_per_connection, 1)
+        return result
+
+
+async def _parked_session(receive: asyncio.Future):
+    """Как websocket_endpoint: ждем следующий кадр без таймеров и повторных задач"""
+    await receive
+
+
+def _fill(manager: ConnectionManager, connections: int, paired_fraction: float) -> int:
+    """Подключаем пользователей; возвращаем, сколько из них оказались в парах"""
+    paired_countries = ("USA", "Japan")
+    paired_target = int(connections * paired_fraction) // 2 * 2
+    for i in range(connections):
+        user_id = str(uuid.UUID(int=i))
+        if i < paired_target:
+            # Чередуем страны - каждый второй сразу находит пару
+            country = paired_countries[i % 2]
+        else:
+            country = "Russia"
+        user_data = {"user_id": user_id, "country": country, "language": "en"}
+        _run(manager.connect(_IdleWebSocket(), user_id, user_data))
+        _run(manager.find_partner(user_data))
+    return paired_target
+
+
+def measure(connections: int, paired_fraction: float = 0.5, parked: bool = False) -> MemoryResult:
+    """Сколько памяти занимают connections соединений в простое"""
+    previous_disable = logging.root.manager.disable
+    logging.disable(logging.INFO)
+    loop = asyncio.new_event_loop() if parked else None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        manager = ConnectionManager()
+        paired = _fill(manager, connections, paired_fraction)
+
+        tasks = []
+        if loop is not None:
+            tasks = [loop.create_task(_parked_session(loop.create_future())) for _ in range(connections)]
+            # Один проход цикла: все корутины доходят до await и паркуются
+            loop.run_until_complete(asyncio.sleep(0))
+
+        gc.collect()
+        total = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+        logging.disable(previous_disable)
+
+    if loop is not None:
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.close()
+
+    return MemoryResult(connections, manager.get_waiting_queue_size(), paired, parked, total)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Bridge per-connection memory benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Numbers of simulated connections")
+    parser.add_argument("--paired-fraction", type=float, default=0.5,
+                        help="Share of connections that are in an (idle) conversation")
+    parser.add_argument("--parked", action="store_true",
+                        help="Also park one receive coroutine per connection")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in args.sizes:
+        result = measure(size, args.paired_fraction, args.parked)
+        results.append(result)
+        if not args.json:
+            print(result.format(), flush=True)
+
+    if args.json:
+        print(json.dumps([result.to_dict() for result in results], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Воспроизведение записанного трафика /ws против локального сервера.
+
+Запись включается на сервере переменной BRIDGE_CAPTURE_PATH (см. utils/traffic_recorder.py),
+при WORKERS > 1 каждый воркер пишет свой файл (capture.1.jsonl.gz и т.д.).
+Драйвер открывает по соединению на каждое записанное, отправляет кадры клиента
+в исходном темпе (или ускоренно) и сравнивает, когда приходят ответы сервера,
+с тем, когда они приходили в записи.
+
+Пример:
+    python -m backend.tools.replay capture.jsonl.gz --url ws://localhost:8000/ws --speed 4
+"""
+import argparse
+import asyncio
+import json
+import math
+import sys
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.utils.traffic_recorder import CONNECT, INBOUND, OUTBOUND, CLOSE, load_capture
+
+# Сколько ждем недостающие ответы сервера после последнего записанного события
+DEFAULT_GRACE = 2.0
+
+
+@dataclass
+class FrameTiming:
+    frame_type: str
+    expected: float  # Когда кадр пришел в записи (с учетом ускорения), секунды от старта
+    actual: Optional[float] = None  # Когда пришел при воспроизведении
+
+    @property
+    def lag(self) -> Optional[float]:
+        return None if self.actual is None else self.actual - self.expected
+
+
+@dataclass
+class ReplayReport:
+    connections: int = 0
+    timings: List[FrameTiming] = field(default_factory=list)
+    unexpected_frames: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def lag_percentiles(self, frame_type: Optional[str] = None) -> Dict[str, float]:
+        lags = sorted(
+            timing.lag for timing in self.timings
+            if timing.lag is not None and (frame_type is None or timing.frame_type == frame_type)
+        )
+        if not lags:
+            return {}
+        last = len(lags) - 1
+        result = {f"p{p}": lags[min(last, int(last * p / 100))] for p in (50, 95, 99)}
+        result["max"] = lags[-1]
+        return result
+
+    @property
+    def missing_frames(self) -> int:
+        return sum(1 for timing in self.timings if timing.actual is None)
+
+    def regressions(self, threshold: float) -> List[str]:
+        """Типы кадров, у которых p95 задержки относительно записи превышает порог"""
+        frame_types = sorted({timing.frame_type for timing in self.timings})
+        return [
+            frame_type for frame_type in frame_types
+            if self.lag_percentiles(frame_type).get("p95", 0.0) > threshold
+        ]
+
+    def format(self, threshold: float) -> str:
+        lines = [
+            f"Replayed {self.connections} connections, {len(self.timings)} server frames expected, "
+            f"{self.missing_frames} missing, {self.unexpected_frames} unexpected",
+        ]
+        for frame_type in sorted({timing.frame_type for timing in self.timings}):
+            stats = self.lag_percentiles(frame_type)
+            if stats:
+                lines.append(f"  {frame_type:<24} " + "  ".join(
+                    f"{k}={v * 1000:+.1f}ms" for k, v in stats.items()
+                ))
+        regressions = self.regressions(threshold)
+        if regressions:
+            lines.append(f"LATENCY REGRESSION (p95 > {threshold * 1000:.0f}ms): {', '.join(regressions)}")
+        else:
+            lines.append(f"No latency regressions (p95 <= {threshold * 1000:.0f}ms)")
+        lines.extend(f"Error: {error}" for error in self.errors)
+        return "\n".join(lines)
+
+
+def _frame_type(frame: Optional[str]) -> str:
+    try:
+        return json.loads(frame).get("type", "unknown")
+    except (TypeError, ValueError, AttributeError):
+        return "unknown"
+
+
+async def _replay_connection(url: str, events: List[Tuple[float, str, Optional[str]]], origin: float,
+                             started: float, speed: float, grace: float, report: ReplayReport):
+    """Проигрываем одно соединение: отправляем кадры клиента и ловим ответы сервера"""
+    import websockets
+
+    def offset(timestamp: float) -> float:
+        return (timestamp - origin) / speed
+
+    closed_at = next((ts for ts, kind, _ in events if kind == CLOSE), float("inf"))
+    expected = [
+        FrameTiming(_frame_type(frame), offset(ts))
+        for ts, kind, frame in events if kind == OUTBOUND and ts <= closed_at
+    ]
+    report.timings.extend(expected)
+    client_frames = [(offset(ts), kind, frame) for ts, kind, frame in events if kind in (CONNECT, INBOUND, CLOSE)]
+    if not client_frames or client_frames[0][1] != CONNECT:
+        return
+
+    loop = asyncio.get_running_loop()
+    await asyncio.sleep(max(0.0, client_frames[0][0] - (loop.time() - started)))
+
+    try:
+        async with websockets.connect(url) as websocket:
+            async def receive():
+                received = 0
+                async for message in websocket:
+                    now = loop.time() - started
+                    # Ответы сопоставляем по порядку: k-й полученный кадр - k-й записанный
+                    if received < len(expected):
+                        expected[received].actual = now
+                    else:
+                        report.unexpected_frames += 1
+                    received += 1
+
+            receiver = asyncio.create_task(receive())
+            for at, kind, frame in client_frames:
+                await asyncio.sleep(max(0.0, at - (loop.time() - started)))
+                if kind == CLOSE:
+                    break
+                await websocket.send(frame)
+
+            # Ждем хвост ответов сервера после последнего записанного события
+            last_expected = max((timing.expected for timing in expected), default=0.0)
+            deadline = max(last_expected, client_frames[-1][0]) + grace
+            await asyncio.sleep(max(0.0, deadline - (loop.time() - started)))
+            receiver.cancel()
+    except Exception as e:
+        report.errors.append(f"{type(e).__name__}: {e}")
+
+
+def _check_speed(speed: float) -> float:
+    # Ускорение делит время записи: 0 или отрицательное значение ломает расписание кадров
+    if not (math.isfinite(speed) and speed > 0):
+        raise ValueError(f"speed must be a positive number, got {speed}")
+    return speed
+
+
+def _speed_arg(value: str) -> float:
+    try:
+        return _check_speed(float(value))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+async def replay(path: str, url: str, speed: float = 1.0, grace: float = DEFAULT_GRACE) -> ReplayReport:
+    """Воспроизводим весь лог и возвращаем отчет о задержках"""
+    _check_speed(speed)
+    connections = load_capture(path)
+    report = ReplayReport(connections=len(connections))
+    if not connections:
+        return report
+
+    origin = min(events[0][0] for events in connections.values())
+    started = asyncio.get_running_loop().time()
+    await asyncio.gather(*(
+        _replay_connection(url, events, origin, started, speed, grace, report)
+        for events in connections.values()
+    ))
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Replay a recorded Bridge /ws capture")
+    parser.add_argument("capture", help="Capture file written by BRIDGE_CAPTURE_PATH")
+    parser.add_argument("--url", default="ws://localhost:8000/ws")
+    parser.add_argument("--speed", type=_speed_arg, default=1.0, help="Playback speed multiplier")
+    parser.add_argument("--threshold-ms", type=float, default=50.0,
+                        help="Allowed p95 lag versus the recording before flagging a regression")
+    parser.add_argument("--grace", type=float, default=DEFAULT_GRACE)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(replay(args.capture, args.url, args.speed, args.grace))
+    threshold = args.threshold_ms / 1000
+    print(report.format(threshold))
+    sys.exit(1 if report.regressions(threshold) or report.missing_frames else 0)
+
+
+if __name__ == "__main__":
+    main()
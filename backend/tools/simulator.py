@@ -0,0 +1,344 @@
+"""Детерминированный симулятор подбора пар для планирования мощностей.
+
+Прогоняет логику ConnectionManager на синтетическом или записанном потоке
+приходов и уходов пользователей с виртуальными часами, без сокетов и event loop.
+
+Пример:
+    python -m backend.tools.simulator --duration 3600 --rate Russia=5 --rate USA=3
+    python -m backend.tools.simulator --trace arrivals.csv
+
+Формат записанной трассы (CSV с заголовком): time,event,user_id,country,language
+где event - arrive или leave. Клиенты считаются присылающими heartbeat,
+поэтому очистка неактивных соединений не моделируется.
+"""
+import argparse
+import asyncio
+import csv
+import heapq
+import json
+import logging
+import random
+import sys
+import os
+import time
+from array import array
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Coroutine, Dict, Iterable, Iterator, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.utils.connection_manager import ConnectionManager
+from backend.utils.handshake import COUNTRIES
+
+# Типы событий
+ARRIVE = "arrive"
+LEAVE = "leave"
+ABANDON = "abandon"
+END_CHAT = "end_chat"
+
+
+class _NullWebSocket:
+    """Заглушка сокета: сообщения сервера в симуляции никуда не уходят"""
+    async def send_text(self, message):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+
+def _run(coro: Coroutine) -> Any:
+    """Выполняем корутину менеджера синхронно (она не должна реально ждать)"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("ConnectionManager operation suspended inside the simulator")
+
+
+@dataclass
+class Arrival:
+    time: float
+    user_id: str
+    country: str
+    language: str = "en"
+    patience: Optional[float] = None  # Сколько пользователь готов ждать пару
+    chat_duration: Optional[float] = None  # Длительность разговора после подбора
+
+
+@dataclass
+class SimulationReport:
+    arrivals: int = 0
+    matched: int = 0
+    abandoned: int = 0
+    still_waiting: int = 0
+    max_queue: int = 0
+    simulated_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    wait_percentiles: Dict[str, float] = field(default_factory=dict)
+    pair_matches: Dict[str, int] = field(default_factory=dict)
+    country_match_rate: Dict[str, float] = field(default_factory=dict)
+    op_stats: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.__dict__.copy()
+
+    def format(self) -> str:
+        """Человекочитаемый отчет"""
+        rate = self.arrivals / self.wall_seconds * 60 if self.wall_seconds else 0.0
+        lines = [
+            f"Simulated {self.simulated_seconds:.0f}s in {self.wall_seconds:.2f}s wall "
+            f"({rate:,.0f} users/min)",
+            f"Arrivals: {self.arrivals}  matched: {self.matched}  abandoned: {self.abandoned}  "
+            f"still waiting: {self.still_waiting}  max queue: {self.max_queue}",
+            "Wait time (s): " + "  ".join(f"{k}={v:.2f}" for k, v in self.wait_percentiles.items()),
+            "Matches per country pair:",
+        ]
+        for pair, count in sorted(self.pair_matches.items(), key=lambda item: -item[1]):
+            lines.append(f"  {pair:<30} {count}")
+        lines.append("Match rate per country:")
+        for country, share in sorted(self.country_match_rate.items()):
+            lines.append(f"  {country:<30} {share:.1%}")
+        lines.append("Manager CPU time per operation:")
+        for op, stats in sorted(self.op_stats.items()):
+            lines.append(f"  {op:<20} calls={stats['calls']:<10} mean={stats['mean_us']:.2f}us "
+                         f"total={stats['total_s']:.3f}s")
+        return "\n".join(lines)
+
+
+def generate_arrivals(rates: Dict[str, float], duration: float, mean_patience: float = 120.0,
+                      mean_chat: float = 180.0, language: str = "en", seed: int = 0) -> Iterator[Arrival]:
+    """Синтетический пуассоновский поток приходов по странам (в порядке времени)"""
+    rng = random.Random(seed)
+    countries = list(rates)
+    weights = [rates[country] for country in countries]
+    total_rate = sum(weights)
+    if total_rate <= 0:
+        return
+
+    now = 0.0
+    user_number = 0
+    while True:
+        now += rng.expovariate(total_rate)
+        if now > duration:
+            return
+        user_number += 1
+        yield Arrival(
+            time=now,
+            user_id=f"sim-{user_number}",
+            country=rng.choices(countries, weights)[0],
+            language=language,
+            patience=rng.expovariate(1 / mean_patience) if mean_patience > 0 else None,
+            chat_duration=rng.expovariate(1 / mean_chat) if mean_chat > 0 else None,
+        )
+
+
+def load_trace(path: str) -> Iterator[Tuple[float, str, Dict[str, str]]]:
+    """Читаем записанную трассу приходов и уходов, отсортированную по времени"""
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield float(row["time"]), row["event"], row
+
+
+def _percentiles(values: array) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    result = {f"p{p}": ordered[min(last, int(last * p / 100))] for p in (50, 90, 99)}
+    result["max"] = ordered[-1]
+    result["mean"] = sum(ordered) / len(ordered)
+    return result
+
+
+class MatchmakingSimulator:
+    """Дискретно-событийная модель сервера поверх настоящего ConnectionManager"""
+
+    def __init__(self, manager: Optional[ConnectionManager] = None):
+        self.now = 0.0
+        self.manager = manager or ConnectionManager(clock=lambda: self.now)
+        self.manager.clock = lambda: self.now
+        self._websocket = _NullWebSocket()
+        self._events: List[Tuple[float, int, str, Any]] = []
+        self._seq = 0
+        self._arrived_at: Dict[str, float] = {}
+        self._countries: Dict[str, str] = {}
+        self._op_ns: Dict[str, int] = defaultdict(int)
+        self._op_calls: Counter = Counter()
+        self._waits = array("d")
+        self._pairs: Counter = Counter()
+        self._arrivals_by_country: Counter = Counter()
+        self._matched_by_country: Counter = Counter()
+        self.report = SimulationReport()
+
+    def _schedule(self, at: float, kind: str, payload: Any):
+        self._seq += 1
+        heapq.heappush(self._events, (at, self._seq, kind, payload))
+
+    def _timed(self, op: str, result_or_coro: Any, started: int) -> Any:
+        result = _run(result_or_coro) if asyncio.iscoroutine(result_or_coro) else result_or_coro
+        self._op_ns[op] += time.perf_counter_ns() - started
+        self._op_calls[op] += 1
+        return result
+
+    def _arrive(self, arrival: Arrival):
+        manager = self.manager
+        user_id = arrival.user_id
+        # Статистику считаем по каноническому названию, как его видит менеджер:
+        # "USA", "usa" и "United States" - одна страна
+        country = COUNTRIES.name(COUNTRIES.intern(arrival.country)) or arrival.country
+        user_data = {"user_id": user_id, "country": country, "language": arrival.language}
+        self._arrived_at[user_id] = self.now
+        self._countries[user_id] = country
+        self._arrivals_by_country[country] += 1
+        self.report.arrivals += 1
+
+        started = time.perf_counter_ns()
+        self._timed("connect", manager.connect(self._websocket, user_id, user_data), started)
+        started = time.perf_counter_ns()
+        partner = self._timed("find_partner", manager.find_partner(user_data), started)
+
+        if partner is None:
+            self.report.max_queue = max(self.report.max_queue, manager.get_waiting_queue_size())
+            if arrival.patience is not None:
+                self._schedule(self.now + arrival.patience, ABANDON, user_id)
+            return
+
+        # find_partner уже связал обоих пользователей
+        partner_id = partner["user_id"]
+        self._record_match(user_id, partner_id)
+        if arrival.chat_duration is not None:
+            self._schedule(self.now + arrival.chat_duration, END_CHAT, user_id)
+
+    def _record_match(self, user_id: str, partner_id: str):
+        self.report.matched += 2
+        for uid in (user_id, partner_id):
+            self._waits.append(self.now - self._arrived_at[uid])
+            self._matched_by_country[self._countries[uid]] += 1
+        pair = " <-> ".join(sorted((self._countries[user_id], self._countries[partner_id])))
+        self._pairs[pair] += 1
+
+    def _partner_of(self, user_id: str) -> Optional[str]:
+        return self.manager.get_partner_id(user_id)
+
+    def _leave(self, user_id: str):
+        """Пользователь уходит; если он был в паре, разговор заканчивается для обоих"""
+        if user_id not in self._arrived_at:
+            return
+        partner_id = self._partner_of(user_id)
+        if partner_id is None:
+            self.report.abandoned += 1
+        for uid in (user_id, partner_id):
+            if uid is None or uid not in self._arrived_at:
+                continue
+            started = time.perf_counter_ns()
+            self._timed("disconnect", self.manager.disconnect(uid), started)
+            del self._arrived_at[uid]
+            del self._countries[uid]
+
+    def _abandon(self, user_id: str):
+        # Уходит только тот, кто все еще ждет пару
+        if user_id in self._arrived_at and self._partner_of(user_id) is None:
+            self._leave(user_id)
+
+    def run(self, arrivals: Iterable[Arrival] = (),
+            trace: Iterable[Tuple[float, str, Dict[str, str]]] = ()) -> SimulationReport:
+        """Прогоняем события до исчерпания потока и возвращаем отчет"""
+        for at, event, row in trace:
+            if event == ARRIVE:
+                self._schedule(at, ARRIVE, Arrival(at, row["user_id"], row["country"],
+                                                   row.get("language") or "en"))
+            elif event == LEAVE:
+                self._schedule(at, LEAVE, row["user_id"])
+
+        # Логи менеджера в симуляции только мешают и искажают замеры
+        previous_disable = logging.root.manager.disable
+        logging.disable(logging.INFO)
+        try:
+            self._loop(iter(arrivals))
+        finally:
+            logging.disable(previous_disable)
+        return self._build_report()
+
+    def _loop(self, arrivals: Iterator[Arrival]):
+        self._wall_started = time.perf_counter()
+        next_arrival = next(arrivals, None)
+        events = self._events
+
+        while next_arrival is not None or events:
+            # Сливаем ленивый поток приходов с очередью отложенных событий
+            if next_arrival is not None and (not events or next_arrival.time <= events[0][0]):
+                self.now = next_arrival.time
+                self._arrive(next_arrival)
+                next_arrival = next(arrivals, None)
+                continue
+
+            self.now, _, kind, payload = heapq.heappop(events)
+            if kind == ARRIVE:
+                self._arrive(payload)
+            elif kind == LEAVE:
+                self._leave(payload)
+            elif kind == ABANDON:
+                self._abandon(payload)
+            elif kind == END_CHAT:
+                self._leave(payload)
+
+    def _build_report(self) -> SimulationReport:
+        report = self.report
+        report.wall_seconds = time.perf_counter() - self._wall_started
+        report.simulated_seconds = self.now
+        report.still_waiting = self.manager.get_waiting_queue_size()
+        report.wait_percentiles = _percentiles(self._waits)
+        report.pair_matches = dict(self._pairs)
+        report.country_match_rate = {
+            country: self._matched_by_country[country] / count
+            for country, count in self._arrivals_by_country.items()
+        }
+        report.op_stats = {
+            op: {
+                "calls": self._op_calls[op],
+                "total_s": self._op_ns[op] / 1e9,
+                "mean_us": self._op_ns[op] / self._op_calls[op] / 1e3,
+            }
+            for op in self._op_calls
+        }
+        return report
+
+
+def _parse_rates(values: List[str]) -> Dict[str, float]:
+    rates = {}
+    for value in values:
+        country, _, rate = value.partition("=")
+        if not rate:
+            raise argparse.ArgumentTypeError(f"Expected COUNTRY=RATE, got {value!r}")
+        rates[country] = float(rate)
+    return rates
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Bridge matchmaking simulator")
+    parser.add_argument("--trace", help="CSV trace with time,event,user_id,country,language")
+    parser.add_argument("--rate", action="append", default=[],
+                        help="Arrival rate per second for a country, e.g. Russia=5 (repeatable)")
+    parser.add_argument("--duration", type=float, default=3600.0, help="Simulated seconds")
+    parser.add_argument("--patience", type=float, default=120.0, help="Mean wait before leaving, s")
+    parser.add_argument("--chat", type=float, default=180.0, help="Mean conversation length, s")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    simulator = MatchmakingSimulator()
+    if args.trace:
+        report = simulator.run(trace=load_trace(args.trace))
+    else:
+        rates = _parse_rates(args.rate) or {"Russia": 5.0, "USA": 5.0, "Germany": 2.0, "Japan": 1.0}
+        report = simulator.run(arrivals=generate_arrivals(
+            rates, args.duration, args.patience, args.chat, seed=args.seed
+        ))
+
+    print(json.dumps(report.to_dict(), indent=2) if args.json else report.format())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Set, Union
+
+from . import messages
+
+# Верхняя граница задержки склейки: дольше ждать - уже заметно в живом чате
+MAX_CHAT_BATCH_DELAY = 0.05
+
+# Готовый кадр или функция, которая соберет его в момент отправки (например, с меткой времени отправки)
+Frame = Union[str, Callable[[], str]]
+
+
+def _render(frame: Frame) -> str:
+    return frame if isinstance(frame, str) else frame()
+
+
+class ChatBatcher:
+    """Склейка сообщений одному получателю в кадр chat_batch (в духе алгоритма Нейгла).
+
+    Первое сообщение после паузы уходит сразу. Сообщения, пришедшие в течение
+    delay после предыдущей отправки, копятся и уходят одним кадром - не позже,
+    чем через delay, или сразу, как только их наберется max_messages.
+    Кадр-функция вызывается непосредственно перед отправкой, поэтому метки
+    времени в нем учитывают и время ожидания в пачке.
+    """
+
+    def __init__(self, send: Callable[[str, str], Awaitable[None]], delay: float,
+                 max_messages: int = 32, clock: Callable[[], float] = time.monotonic):
+        self._send = send  # send(frame, user_id), например ConnectionManager.send_personal_message
+        self.delay = min(delay, MAX_CHAT_BATCH_DELAY)
+        self.max_messages = max_messages
+        self.clock = clock
+        self._pending: Dict[str, List[Frame]] = {}
+        self._last_sent: Dict[str, float] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._flush_tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, frame: Frame, user_id: str):
+        """Отправляем chat_message получателю сразу или в составе пачки"""
+        pending = self._pending.get(user_id)
+        if pending is None:
+            now = self.clock()
+            last_sent = self._last_sent.get(user_id)
+            if last_sent is None or now - last_sent >= self.delay:
+                # Канал простаивал - задержка ничего не даст, отправляем сразу
+                self._last_sent[user_id] = now
+                await self._send(_render(frame), user_id)
+                return
+
+            # Недавно уже отправляли - копим до конца окна
+            pending = self._pending[user_id] = []
+            self._timers[user_id] = asyncio.get_running_loop().call_later(
+                last_sent + self.delay - now, self._flush_later, user_id
+            )
+
+        pending.append(frame)
+        if len(pending) >= self.max_messages:
+            await self.flush(user_id)
+
+    def _flush_later(self, user_id: str):
+        self._timers.pop(user_id, None)
+        task = asyncio.ensure_future(self.flush(user_id))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def flush(self, user_id: str):
+        """Отправляем накопленное получателю одним кадром"""
+        timer = self._timers.pop(user_id, None)
+        if timer is not None:
+            timer.cancel()
+        frames = self._pending.pop(user_id, None)
+        if not frames:
+            return
+
+        self._last_sent[user_id] = self.clock()
+        rendered = [_render(frame) for frame in frames]
+        frame = rendered[0] if len(rendered) == 1 else messages.chat_batch(rendered)
+        try:
+            await self._send(frame, user_id)
+        except Exception as e:
+            logging.debug(f"Failed to flush {len(frames)} messages to {user_id}: {e}")
+
+    async def flush_all(self):
+        for user_id in list(self._pending):
+            await self.flush(user_id)
+
+    async def close(self):
+        """Перед закрытием соединений: новые сообщения уходят сразу, накопленные - одним кадром"""
+        self.delay = 0.0
+        await self.flush_all()
+
+    def forget(self, user_id: str):
+        """Получатель отключился - его очередь больше не нужна"""
+        timer = self._timers.pop(user_id, None)
+        if timer is not None:
+            timer.cancel()
+        self._pending.pop(user_id, None)
+        self._last_sent.pop(user_id, None)
+
+    def pending_count(self, user_id: str) -> int:
+        return len(self._pending.get(user_id, ()))
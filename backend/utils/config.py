@@ -0,0 +1,156 @@
+import os
+from dataclasses import dataclass, fields
+from typing import Mapping, Optional
+
+from .batching import MAX_CHAT_BATCH_DELAY
+
+# Значение SECRET_KEY из .env.example - не секрет, админ-API с ним не включаем
+PLACEHOLDER_SECRET_KEY = "your-secret-key-here"
+# Номер воркера, который serve() выставляет каждому процессу при WORKERS > 1
+WORKER_ENV = "BRIDGE_WORKER"
+
+
+def _parse_bool(value: str) -> bool:
+    lowered = value.strip().lower()
+    if lowered in ("1", "true", "yes", "on"):
+        return True
+    if lowered in ("0", "false", "no", "off", ""):
+        return False
+    raise ValueError(f"expected a boolean, got {value!r}")
+
+
+def current_worker() -> Optional[str]:
+    """Номер текущего воркера или None, если сервер работает одним процессом"""
+    return os.environ.get(WORKER_ENV)
+
+
+def worker_path(path: str, worker: str) -> str:
+    """Отдельный файл воркера: state.json -> state.1.json, capture.jsonl.gz -> capture.jsonl.1.gz"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{worker}{ext}"
+
+
+def load_env_file(path: str = ".env"):
+    """Подгружаем .env, если установлен python-dotenv (переменные окружения важнее)"""
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv(path, override=False)
+
+
+@dataclass(frozen=True)
+class ServerConfig:
+    """Настройки сервера из переменных окружения (см. .env.example)"""
+
+    host: str = "0.0.0.0"
+    port: int = 8000
+    debug: bool = False
+    secret_key: Optional[str] = None
+
+    # Процессы: при workers > 1 каждый процесс слушает порт через SO_REUSEPORT
+    workers: int = 1
+    backlog: int = 2048
+
+    # Таймауты и интервалы, секунды
+    connection_timeout: float = 60.0  # Ожидание данных пользователя после подключения
+    inactivity_timeout: float = 30.0  # Без heartbeat дольше этого - соединение чистится
+    cleanup_interval: float = 60.0
+    heartbeat_interval: float = 15.0  # Сообщается клиенту в connection_established
+
+    # Склейка chat_message в chat_batch для клиентов, приславших "batching": true (0 - выключено)
+    chat_batch_delay: float = 0.0  # Секунды, не больше MAX_CHAT_BATCH_DELAY
+    chat_batch_max_messages: int = 32
+
+    # Ограничения WebSocket
+    ws_max_size: int = 64 * 1024  # Максимальный размер кадра, байт
+    ws_max_queue: int = 32  # Очередь входящих кадров на соединение
+    ws_ping_interval: float = 20.0
+    ws_ping_timeout: float = 20.0
+
+    # Плавный перезапуск
+    drain_batch_size: int = 100
+    drain_batch_interval: float = 1.0
+    reconnect_jitter: float = 5.0
+    snapshot_path: Optional[str] = None
+    capture_path: Optional[str] = None
+
+    @property
+    def admin_token(self) -> Optional[str]:
+        """Токен для /admin/*; None - SECRET_KEY не задан и админ-API выключен"""
+        if not self.secret_key or self.secret_key == PLACEHOLDER_SECRET_KEY:
+            return None
+        return self.secret_key
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None) -> "ServerConfig":
+        """Собираем конфигурацию из окружения, проверяя типы значений"""
+        env = os.environ if env is None else env
+        values = {}
+        for field in fields(cls):
+            name = ENV_NAMES[field.name]
+            raw = env.get(name)
+            if raw is None or (raw == "" and field.type is not str):
+                continue
+            try:
+                if field.type is bool:
+                    values[field.name] = _parse_bool(raw)
+                elif field.type is int:
+                    values[field.name] = int(raw)
+                elif field.type is float:
+                    values[field.name] = float(raw)
+                else:
+                    values[field.name] = raw
+            except ValueError as e:
+                raise ValueError(f"Invalid value for {name}: {e}") from None
+
+        config = cls(**values)
+        config.validate()
+        return config
+
+    def validate(self):
+        if not 0 < self.port < 65536:
+            raise ValueError(f"API_PORT must be in 1..65535, got {self.port}")
+        if self.workers < 1:
+            raise ValueError(f"WORKERS must be at least 1, got {self.workers}")
+        for name in ("connection_timeout", "inactivity_timeout", "cleanup_interval",
+                     "heartbeat_interval", "ws_ping_interval", "ws_ping_timeout"):
+            if getattr(self, name) <= 0:
+                raise ValueError(f"{ENV_NAMES[name]} must be positive")
+        if not 0 <= self.chat_batch_delay <= MAX_CHAT_BATCH_DELAY:
+            raise ValueError(f"CHAT_BATCH_DELAY must be in 0..{MAX_CHAT_BATCH_DELAY}s, got {self.chat_batch_delay}")
+        # Размеры и счетчики: 0 ломает range() в дренаже или лимиты WebSocket
+        for name in ("backlog", "chat_batch_max_messages", "ws_max_size", "ws_max_queue", "drain_batch_size"):
+            if getattr(self, name) < 1:
+                raise ValueError(f"{ENV_NAMES[name]} must be at least 1, got {getattr(self, name)}")
+        for name in ("drain_batch_interval", "reconnect_jitter"):
+            if getattr(self, name) < 0:
+                raise ValueError(f"{ENV_NAMES[name]} must not be negative, got {getattr(self, name)}")
+        if self.heartbeat_interval >= self.inactivity_timeout:
+            raise ValueError("HEARTBEAT_INTERVAL must be shorter than INACTIVITY_TIMEOUT")
+
+
+# Поле конфигурации -> переменная окружения
+ENV_NAMES = {
+    "host": "API_HOST",
+    "port": "API_PORT",
+    "debug": "DEBUG",
+    "secret_key": "SECRET_KEY",
+    "workers": "WORKERS",
+    "backlog": "BACKLOG",
+    "connection_timeout": "CONNECTION_TIMEOUT",
+    "inactivity_timeout": "INACTIVITY_TIMEOUT",
+    "cleanup_interval": "CLEANUP_INTERVAL",
+    "heartbeat_interval": "HEARTBEAT_INTERVAL",
+    "chat_batch_delay": "CHAT_BATCH_DELAY",
+    "chat_batch_max_messages": "CHAT_BATCH_MAX_MESSAGES",
+    "ws_max_size": "WS_MAX_SIZE",
+    "ws_max_queue": "WS_MAX_QUEUE",
+    "ws_ping_interval": "WS_PING_INTERVAL",
+    "ws_ping_timeout": "WS_PING_TIMEOUT",
+    "drain_batch_size": "DRAIN_BATCH_SIZE",
+    "drain_batch_interval": "DRAIN_BATCH_INTERVAL",
+    "reconnect_jitter": "RECONNECT_JITTER",
+    "snapshot_path": "BRIDGE_SNAPSHOT_PATH",
+    "capture_path": "BRIDGE_CAPTURE_PATH",
+}
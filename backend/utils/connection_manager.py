@@ -1,132 +1,584 @@
+import asyncio
+import glob
+import itertools
 import json
 import logging
+import os
+import random
+import threading
 import time
-from typing import Dict, List, Optional, Any
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterator, List, Mapping, Optional, Any, Tuple
 
+from . import messages
+from .config import worker_path
+from .handshake import COUNTRIES, LANGUAGES
+
+# Код закрытия WebSocket "Service Restart" (RFC 6455)
+SERVICE_RESTART_CODE = 1012
+# Сколько секунд снимок состояния считается актуальным
+SNAPSHOT_TTL = 300
+# Число шардов состояния соединений по умолчанию
+DEFAULT_SHARDS = 16
+# Сколько секунд восстановленный после перезапуска пользователь ждет прежнего партнера,
+# прежде чем его можно сосватать с кем-то другим
+RESUME_GRACE = 10.0
+
+
+class Session:
+    """Компактная запись о подключенном пользователе.
+
+    Вместо двух словарей на соединение (служебный и user_data клиента) храним
+    фиксированный набор полей в __slots__; страна и язык - целые ID из таблиц
+    handshake, словарь user_data собирается по запросу.
+    """
+
+    __slots__ = ("user_id", "websocket", "country_id", "language_id", "partner_id",
+                 "last_activity", "waiting_seq", "batching", "resume_token")
+
+    def __init__(self, user_id: str, websocket, country_id: int = 0, language_id: int = 0,
+                 last_activity: float = 0.0, batching: bool = False,
+                 resume_token: Optional[str] = None):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.country_id = country_id
+        self.language_id = language_id
+        self.partner_id: Optional[str] = None
+        self.last_activity = last_activity
+        self.waiting_seq = -1  # Порядковый номер в очереди ожидания (-1 - не ждет)
+        self.batching = batching  # Клиент умеет разбирать chat_batch
+        self.resume_token = resume_token  # Секрет для восстановления сессии после перезапуска
+
+    @classmethod
+    def from_user_data(cls, user_id: str, websocket, user_data: Dict[str, Any],
+                       last_activity: float = 0.0) -> "Session":
+        # Данные после parse_handshake уже содержат ID; остальные (тесты, симулятор, снимок) переводим здесь
+        cid = user_data.get('country_id')
+        lid = user_data.get('language_id')
+        return cls(
+            user_id, websocket,
+            COUNTRIES.intern(user_data.get('country')) if cid is None else cid,
+            LANGUAGES.intern(user_data.get('language')) if lid is None else lid,
+            last_activity,
+            batching=user_data.get('batching') is True,
+            resume_token=user_data.get('resume_token')
+        )
+
+    @property
+    def country(self) -> Optional[str]:
+        return COUNTRIES.name(self.country_id)
+
+    @property
+    def language(self) -> Optional[str]:
+        return LANGUAGES.name(self.language_id)
+
+    @property
+    def user_data(self) -> Dict[str, Any]:
+        return {"user_id": self.user_id, "country": self.country, "language": self.language}
+
+
+class _Shard:
+    """Часть сессий со своей блокировкой.
+
+    Блокировка потоковая: она берется только на короткие синхронные участки
+    (никогда не через await), поэтому работает и из корутин, и из синхронного кода,
+    и при нескольких потоках в сборке Python без GIL.
+    """
+
+    __slots__ = ("lock", "sessions")
 
-class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, Dict[str, Any]] = {}
-        self.waiting_users: List[Dict[str, Any]] = []
-        self.last_activity: Dict[str, float] = {}  # Отслеживаем активность
+        self.lock = threading.Lock()
+        self.sessions: Dict[str, Session] = {}
+
+
+class _ShardedView(Mapping):
+    """Объединенное представление сессий из всех шардов (только чтение)"""
+
+    __slots__ = ("_shards",)
+
+    def __init__(self, shards: List[_Shard]):
+        self._shards = shards
+
+    @staticmethod
+    def _shard_items(shard: _Shard) -> List[Tuple[str, Session]]:
+        # Копируем под блокировкой, чтобы итерация не ломалась от параллельных изменений
+        with shard.lock:
+            return list(shard.sessions.items())
+
+    def __getitem__(self, user_id: str) -> Session:
+        shards = self._shards
+        return shards[hash(user_id) % len(shards)].sessions[user_id]
+
+    def __contains__(self, user_id: object) -> bool:
+        shards = self._shards
+        return user_id in shards[hash(user_id) % len(shards)].sessions
+
+    def __len__(self) -> int:
+        return sum(len(shard.sessions) for shard in self._shards)
+
+    def __iter__(self) -> Iterator[str]:
+        for shard in self._shards:
+            for user_id, _ in self._shard_items(shard):
+                yield user_id
+
+    def items(self) -> List[Tuple[str, Session]]:
+        return [item for shard in self._shards for item in self._shard_items(shard)]
+
+    def values(self) -> List[Session]:
+        return [session for _, session in self.items()]
+
+
+class ConnectionManager:
+    """Состояние соединений и очереди ожидания.
+
+    Соединения разложены по шардам по хешу user_id, у каждого шарда своя блокировка.
+    Очередь ожидания - индекс по странам с общей блокировкой: подбор пары идет
+    через индекс и связывает пользователей из разных шардов атомарно.
+    Порядок блокировок всегда один: очередь, затем шарды по возрастанию номера.
+    """
+
+    def __init__(self, snapshot_path: Optional[str] = None, clock: Callable[[], float] = time.time,
+                 inactivity_timeout: float = 30.0, num_shards: int = DEFAULT_SHARDS,
+                 resume_grace: float = RESUME_GRACE):
+        self._shards = [_Shard() for _ in range(num_shards)]
+        self.active_connections: Mapping[str, Session] = _ShardedView(self._shards)
+
+        # Очередь ожидания: ID страны -> {user_id: Session} в порядке прихода
+        self._queue_lock = threading.Lock()
+        self._waiting_by_country: Dict[int, "OrderedDict[str, Session]"] = {}
+        self._waiting_count = 0
+        self._waiting_seq = itertools.count()
+        # Восстановленные пользователи, ждущие прежнего партнера: user_id -> до какого времени
+        self._reserved: Dict[str, float] = {}
+        self.resume_grace = resume_grace
+
+        self.draining = False  # Режим дренажа: не принимаем новых и не подбираем пары
+        self.snapshot_path = snapshot_path
+        self.worker: Optional[str] = None  # Номер воркера при WORKERS > 1: снимок пишется в свой файл
+        self.restored_sessions: Dict[str, Dict[str, Any]] = {}
+        self._snapshot_mtimes: Dict[str, float] = {}
+        self.clock = clock  # Источник времени (в симуляторе - виртуальные часы)
+        self.inactivity_timeout = inactivity_timeout  # Секунд без heartbeat до отключения
+
+    def _shard_for(self, user_id: str) -> _Shard:
+        return self._shards[hash(user_id) % len(self._shards)]
+
+    def _locked_shards(self, *user_ids: str) -> List[_Shard]:
+        """Шарды пользователей без повторов, в порядке захвата блокировок"""
+        indexes = sorted({hash(user_id) % len(self._shards) for user_id in user_ids})
+        return [self._shards[i] for i in indexes]
+
+    def get_session(self, user_id: str) -> Optional[Session]:
+        return self._shard_for(user_id).sessions.get(user_id)
 
     async def connect(self, websocket, user_id: str, user_data: Dict[str, Any]):
         """Добавляем пользователя в активные соединения"""
-        self.active_connections[user_id] = {
-            "websocket": websocket,
-            "user_data": user_data,
-            "partner_id": None
-        }
-        self.last_activity[user_id] = time.time()  # Записываем время подключения
-        logging.info(f"User {user_id} connected. Total active: {len(self.active_connections)}")
+        session = Session.from_user_data(user_id, websocket, user_data, self.clock())  # Записываем время подключения
+        shard = self._shard_for(user_id)
+        with shard.lock:
+            shard.sessions[user_id] = session
+        logging.debug("User %s connected", user_id)
 
     def update_activity(self, user_id: str):
         """Обновляем время последней активности"""
-        if user_id in self.last_activity:
-            self.last_activity[user_id] = time.time()
-            logging.debug(f"Activity updated for user {user_id}")
+        session = self.get_session(user_id)
+        if session is not None:
+            session.last_activity = self.clock()
 
-    async def cleanup_inactive_connections(self):
-        """Очищаем неактивные соединения"""
-        current_time = time.time()
+    def get_partner_id(self, user_id: str) -> Optional[str]:
+        """Текущий партнер пользователя (None, если он не в паре или не подключен)"""
+        session = self.get_session(user_id)
+        return session.partner_id if session else None
+
+    def pair_users(self, user_id: str, partner_id: str) -> bool:
+        """Связываем двух подключенных пользователей в пару (атомарно для обоих шардов)"""
+        shards = self._locked_shards(user_id, partner_id)
+        for shard in shards:
+            shard.lock.acquire()
+        try:
+            user = self._shard_for(user_id).sessions.get(user_id)
+            partner = self._shard_for(partner_id).sessions.get(partner_id)
+            if user is None or partner is None:
+                return False
+            user.partner_id = partner_id
+            partner.partner_id = user_id
+            return True
+        finally:
+            for shard in reversed(shards):
+                shard.lock.release()
+
+    def unpair(self, user_id: str) -> Optional[str]:
+        """Разрываем пару с обеих сторон, возвращаем бывшего партнера, если он еще подключен"""
+        partner_id = self.get_partner_id(user_id)
+        if not partner_id:
+            return None
+        shards = self._locked_shards(user_id, partner_id)
+        for shard in shards:
+            shard.lock.acquire()
+        try:
+            user = self._shard_for(user_id).sessions.get(user_id)
+            if user is not None and user.partner_id == partner_id:
+                user.partner_id = None
+            partner = self._shard_for(partner_id).sessions.get(partner_id)
+            if partner is None or partner.partner_id != user_id:
+                return None
+            partner.partner_id = None
+            return partner_id
+        finally:
+            for shard in reversed(shards):
+                shard.lock.release()
+
+    async def cleanup_inactive_connections(
+            self, before_notify: Optional[Callable[[List[str], List[str]], Awaitable[None]]] = None):
+        """Очищаем неактивные соединения.
+
+        before_notify(отключаемые, их партнеры) вызывается до уведомления партнеров:
+        например, чтобы дослать им склеенные сообщения раньше partner_disconnected.
+        """
+        current_time = self.clock()
         inactive_users = []
 
-        for user_id, last_active in self.last_activity.items():
-            time_since_active = current_time - last_active
-            if current_time - last_active > 30:  # 30 секунд таймаут
+        for user_id, session in self.active_connections.items():
+            time_since_active = current_time - session.last_activity
+            if time_since_active > self.inactivity_timeout:
                 inactive_users.append(user_id)
                 logging.info(f"User {user_id} inactive for {time_since_active:.1f}s")
 
+        # Партнерам отключенных пользователей отправляем одно и то же уведомление разом
+        inactive = set(inactive_users)
+        partners = {self.get_partner_id(user_id) for user_id in inactive_users}
+        partners = [
+            partner_id for partner_id in partners
+            if partner_id and partner_id in self.active_connections and partner_id not in inactive
+        ]
+        if before_notify is not None and inactive_users:
+            await before_notify(inactive_users, partners)
+        await self.broadcast(messages.PARTNER_DISCONNECTED, partners)
+
         for user_id in inactive_users:
             logging.warning(f"Cleaning up inactive connection: {user_id}")
-            await self.force_disconnect(user_id)
+            await self.force_disconnect(user_id, notify_partner=False)
 
-    async def force_disconnect(self, user_id: str):
+    async def force_disconnect(self, user_id: str, notify_partner: bool = True):
         """Принудительно отключаем пользователя"""
-        if user_id in self.active_connections:
-            # Уведомляем партнера если есть
-            partner_id = self.active_connections[user_id].get("partner_id")
-            if partner_id and partner_id in self.active_connections:
-                try:
-                    await self.send_personal_message(
-                        json.dumps({
-                            "type": "partner_disconnected",
-                            "message": "Your conversation partner has disconnected"
-                        }),
-                        partner_id
-                    )
-                    # Очищаем partner_id у партнера
-                    self.active_connections[partner_id]["partner_id"] = None
-                except:
-                    pass
-
-            # Удаляем из всех списков
-            if user_id in self.active_connections:
-                del self.active_connections[user_id]
-            if user_id in self.last_activity:
-                del self.last_activity[user_id]
+        session = self.get_session(user_id)
+        if session is None:
+            return
 
-            # Удаляем из очереди ожидания
-            self.waiting_users = [user for user in self.waiting_users if user.get('user_id') != user_id]
+        # Сначала меняем состояние, потом отправляем: блокировки через await не держим
+        partner_id = self.unpair(user_id)
+        self.disconnect(user_id)
+        if partner_id and notify_partner:
+            try:
+                await self.send_personal_message(messages.PARTNER_DISCONNECTED, partner_id)
+            except Exception as e:
+                logging.debug(f"Failed to notify partner {partner_id}: {e}")
 
-            logging.info(f"Force disconnected user {user_id}")
+        # Обработчик соединения припаркован в receive_text без таймаута:
+        # без закрытия сокета он и сам сокет остались бы висеть
+        try:
+            await session.websocket.close()
+        except Exception as e:
+            logging.debug(f"Failed to close {user_id}: {e}")
+
+        logging.info(f"Force disconnected user {user_id}")
 
     def disconnect(self, user_id: str):
         """Удаляем пользователя при отключении"""
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
+        shard = self._shard_for(user_id)
+        session = shard.sessions.get(user_id)
+        if session is None:
+            return
 
         # Также удаляем из очереди ожидания
-        self.waiting_users = [user for user in self.waiting_users if user.get('user_id') != user_id]
-        logging.info(f"User {user_id} disconnected")
+        with self._queue_lock:
+            self._dequeue(session)
+        with shard.lock:
+            shard.sessions.pop(user_id, None)
+        logging.debug("User %s disconnected", user_id)
+
+    def _dequeue(self, session: Session):
+        """Убираем сессию из индекса очереди (вызывается под _queue_lock)"""
+        self._reserved.pop(session.user_id, None)
+        if session.waiting_seq < 0:
+            return
+        bucket = self._waiting_by_country[session.country_id]
+        if bucket.pop(session.user_id, None) is None:
+            return
+        if not bucket:
+            del self._waiting_by_country[session.country_id]
+        session.waiting_seq = -1
+        self._waiting_count -= 1
+
+    def _enqueue(self, session: Session):
+        """Ставим сессию в конец очереди (вызывается под _queue_lock)"""
+        bucket = self._waiting_by_country.get(session.country_id)
+        if session.waiting_seq >= 0 or (bucket is not None and session.user_id in bucket):
+            return
+        if bucket is None:
+            bucket = self._waiting_by_country[session.country_id] = OrderedDict()
+        session.waiting_seq = next(self._waiting_seq)
+        bucket[session.user_id] = session
+        self._waiting_count += 1
+
+    def _session_or_detached(self, user_data: Dict[str, Any]) -> Session:
+        # Пользователя без соединения (например, в тестах) ставим в очередь отдельной записью
+        session = self.get_session(user_data.get('user_id'))
+        return session if session is not None else Session.from_user_data(user_data.get('user_id'), None, user_data)
+
+    def add_to_waiting(self, user_data: Dict[str, Any]):
+        """Ставим пользователя в очередь ожидания без подбора пары"""
+        session = self._session_or_detached(user_data)
+        with self._queue_lock:
+            self._enqueue(session)
+
+    def is_waiting(self, user_id: str) -> bool:
+        session = self.get_session(user_id)
+        return session is not None and session.waiting_seq >= 0
+
+    @property
+    def waiting_users(self) -> List[Dict[str, Any]]:
+        """Копия очереди ожидания в порядке прихода (для отладки и статистики)"""
+        with self._queue_lock:
+            sessions = [session for bucket in self._waiting_by_country.values() for session in bucket.values()]
+        sessions.sort(key=lambda session: session.waiting_seq)
+        return [session.user_data for session in sessions]
+
+    def _oldest_waiting_from_other_country(self, country_id: int) -> Optional[Session]:
+        """Самый давно ждущий пользователь из другой страны: O(число стран), а не O(очередь)"""
+        now = self.clock() if self._reserved else None
+        best = None
+        for bucket_country_id, bucket in self._waiting_by_country.items():
+            if bucket_country_id == country_id:
+                continue
+            candidate = next(iter(bucket.values())) if now is None else self._first_unreserved(bucket, now)
+            if candidate is not None and (best is None or candidate.waiting_seq < best.waiting_seq):
+                best = candidate
+        return best
+
+    def _first_unreserved(self, bucket: "OrderedDict[str, Session]", now: float) -> Optional[Session]:
+        """Первый в корзине, кто не ждет прежнего партнера (или уже перестал)"""
+        for session in bucket.values():
+            deadline = self._reserved.get(session.user_id)
+            if deadline is None or deadline <= now:
+                return session
+        return None
+
+    def _find_waiting(self, user_id: str) -> Optional[Session]:
+        session = self.get_session(user_id)
+        if session is not None and session.waiting_seq >= 0:
+            return session
+        # Отдельная запись без соединения ищется в индексе
+        for bucket in self._waiting_by_country.values():
+            if user_id in bucket:
+                return bucket[user_id]
+        return None
 
     async def find_partner(self, current_user: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Ищем подходящего партнера для пользователя"""
+        """Ищем подходящего партнера для пользователя и сразу связываем пару"""
         user_id = current_user.get('user_id')
-        user_country = current_user.get('country')
-        user_language = current_user.get('language')
+        session = self._session_or_detached(current_user)
 
-        logging.info(f"Finding partner for user {user_id} from {user_country}")
-        logging.info(f"Current waiting queue: {len(self.waiting_users)} users: {[user.get('country') for user in self.waiting_users]}")
+        logging.debug("Finding partner for user %s from %s", user_id, session.country)
+        # Список стран очереди строим только при включенном DEBUG - на длинной очереди это дорого
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Current waiting queue: {self.get_waiting_queue_size()} users: {[user.get('country') for user in self.waiting_users]}")
 
-        # Сначала удаляем текущего пользователя из очереди (если он там есть)
-        self.waiting_users = [user for user in self.waiting_users if user.get('user_id') != user_id]
+        if self.draining:
+            logging.info(f"Server is draining, skipping matching for {user_id}")
+            return None
 
-        for i, waiting_user in enumerate(self.waiting_users):
-            logging.info(f"Checking user {i}: {waiting_user.get('country')} (ID: {waiting_user.get('user_id')})")
+        with self._queue_lock:
+            # Сначала удаляем текущего пользователя из очереди (если он там есть)
+            self._dequeue(session)
 
-            # Ищем пользователя из ДРУГОЙ страны
-            if (waiting_user.get('country') != user_country and
-                waiting_user.get('user_id') != user_id):
+            # После перезапуска сервера восстанавливаем прежнюю пару, если партнер уже ждет
+            previous_partner_id = current_user.get('previous_partner_id')
+            partner = self._find_waiting(previous_partner_id) if previous_partner_id else None
+            # Партнер еще не переподключился - ждем его, а не отдаем пользователя первому встречному
+            reserve = partner is None and previous_partner_id and self.get_session(previous_partner_id) is None
+            if partner is not None:
+                logging.info(f"✅ Restored pair {user_id} <-> {previous_partner_id}")
+            elif not reserve:
+                # Ищем пользователя из ДРУГОЙ страны
+                partner = self._oldest_waiting_from_other_country(session.country_id)
 
-                # Нашли пару! Удаляем из очереди ожидания
-                self.waiting_users.remove(waiting_user)
-                logging.info(f"✅ Matched user {user_id} from {user_country} with {waiting_user.get('user_id')} from {waiting_user.get('country')}")
-                logging.info(f"✅ Queue after match: {len(self.waiting_users)} users")
-                return waiting_user
+            if partner is not None:
+                # Нашли пару! Удаляем из очереди ожидания и связываем, пока держим очередь
+                self._dequeue(partner)
+                self._link(user_id, partner.user_id)
+                logging.debug("Matched user %s from %s with %s from %s",
+                              user_id, session.country, partner.user_id, partner.country)
+                return partner.user_data
 
-        # Если пару не нашли, добавляем текущего пользователя в очередь
-        if not any(user.get('user_id') == user_id for user in self.waiting_users):
-            self.waiting_users.append(current_user)
-            logging.info(f"⏳ User {user_id} from {user_country} added to waiting list. Queue size: {len(self.waiting_users)}")
+            # Если пару не нашли, добавляем текущего пользователя в очередь
+            # (если он не успел отключиться, иначе в очереди остался бы "призрак")
+            if session.websocket is not None and self.get_session(user_id) is not session:
+                return None
+            self._enqueue(session)
+            if reserve:
+                self._reserved[user_id] = self.clock() + self.resume_grace
+            logging.debug("User %s from %s added to waiting list. Queue size: %s",
+                          user_id, session.country, self._waiting_count)
 
         return None
 
+    def _link(self, user_id: str, partner_id: str):
+        if not self.pair_users(user_id, partner_id):
+            # Кто-то из двоих еще не подключен (или уже ушел) - partner_id выставит вызывающий код
+            logging.debug("Pair %s <-> %s matched without active connections", user_id, partner_id)
+
     async def send_personal_message(self, message: str, user_id: str):
         """Отправляем сообщение конкретному пользователю"""
-        if user_id in self.active_connections:
-            connection = self.active_connections[user_id]["websocket"]
-            await connection.send_text(message)
+        session = self.get_session(user_id)
+        if session is not None:
+            await session.websocket.send_text(message)
+
+    async def broadcast(self, message: str, user_ids: List[str]):
+        """Отправляем один и тот же уже закодированный кадр многим пользователям"""
+        sessions = [self.get_session(user_id) for user_id in user_ids]
+        websockets = [session.websocket for session in sessions if session is not None]
+        if websockets:
+            await asyncio.gather(
+                *(websocket.send_text(message) for websocket in websockets),
+                return_exceptions=True
+            )
 
     def get_waiting_queue_size(self) -> int:
         """Возвращает размер очереди ожидания (для тестирования)"""
-        return len(self.waiting_users)
+        return self._waiting_count
 
 
     async def move_to_chat_mode(self, user_id: str, partner_id: str):
         """Переводим пользователя в режим чата"""
-        if user_id in self.active_connections:
-            self.active_connections[user_id]["partner_id"] = partner_id
+        session = self.get_session(user_id)
+        if session is None:
+            return
+        with self._queue_lock:
             # Удаляем из очереди ожидания
-            self.waiting_users = [user for user in self.waiting_users if user.get('user_id') != user_id]
-            logging.info(f"User {user_id} moved to chat mode with partner {partner_id}")
\ No newline at end of file
+            self._dequeue(session)
+        session.partner_id = partner_id
+        logging.info(f"User {user_id} moved to chat mode with partner {partner_id}")
+
+    def start_drain(self):
+        """Переводим менеджер в режим дренажа перед перезапуском"""
+        self.draining = True
+        logging.info("Drain mode enabled: new users and matching are disabled")
+
+    def snapshot_state(self) -> Dict[str, Any]:
+        """Снимок очереди ожидания и пар, чтобы новый процесс мог их подхватить"""
+        waiting_ids = [user.get('user_id') for user in self.waiting_users]
+        # Ключ - секретный токен: user_id виден партнеру в from_user и для восстановления не годится
+        sessions = {
+            session.resume_token: {"user_id": user_id, "user_data": session.user_data,
+                                   "partner_id": session.partner_id}
+            for user_id, session in self.active_connections.items()
+            if session.resume_token
+        }
+        return {"created_at": time.time(), "waiting": waiting_ids, "sessions": sessions}
+
+    def snapshot_files(self) -> List[str]:
+        """Снимок одиночного процесса и снимки всех воркеров: клиент переподключается к любому"""
+        if not self.snapshot_path:
+            return []
+        files = [self.snapshot_path] if os.path.exists(self.snapshot_path) else []
+        pattern = worker_path(glob.escape(self.snapshot_path), "[0-9]*")
+        return files + sorted(path for path in glob.glob(pattern) if not path.endswith(".tmp"))
+
+    def save_snapshot(self, path: Optional[str] = None):
+        """Записываем снимок состояния в локальный файл (атомарно)"""
+        if path is None and self.snapshot_path and self.worker is not None:
+            path = worker_path(self.snapshot_path, self.worker)
+        path = path or self.snapshot_path
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot_state(), f)
+        os.replace(tmp_path, path)
+        logging.info(f"State snapshot saved to {path}: {len(self.active_connections)} sessions")
+
+    def load_snapshot(self, path: Optional[str] = None) -> int:
+        """Загружаем сессии из снимков предыдущих процессов, возвращает их количество"""
+        paths = [path] if path else self.snapshot_files()
+        return sum(self._load_snapshot_file(snapshot_path) for snapshot_path in paths)
+
+    def _load_snapshot_file(self, path: str) -> int:
+        if not os.path.exists(path):
+            return 0
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to load state snapshot {path}: {e}")
+            return 0
+
+        self._snapshot_mtimes[path] = mtime
+        if time.time() - snapshot.get("created_at", 0) > SNAPSHOT_TTL:
+            logging.info(f"State snapshot {path} is stale, ignoring")
+            return 0
+
+        self.restored_sessions.update(snapshot.get("sessions", {}))
+        logging.info(f"Loaded {len(snapshot.get('sessions', {}))} sessions from {path}")
+        return len(snapshot.get("sessions", {}))
+
+    def restore_session(self, resume_token: str) -> Optional[Dict[str, Any]]:
+        """Забираем сохраненную сессию по токену из connection_established (одноразово)"""
+        if resume_token not in self.restored_sessions and self.snapshot_path:
+            # Старые процессы могли записать снимки уже после нашего запуска;
+            # перечитываем только изменившиеся файлы, чтобы не вернуть уже выданные сессии
+            for path in self.snapshot_files():
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                if mtime != self._snapshot_mtimes.get(path):
+                    self._load_snapshot_file(path)
+        return self.restored_sessions.pop(resume_token, None)
+
+    async def drain_connections(self, batch_size: int = 100, batch_interval: float = 1.0,
+                                reconnect_jitter: float = 5.0):
+        """Закрываем соединения пачками с подсказкой о переподключении"""
+        self.start_drain()
+        self.save_snapshot()
+
+        # Партнеры закрываются в одной пачке, чтобы разговор не обрывался с одной стороны:
+        # сначала идут пары (при четном batch_size они не разрываются), потом одиночки
+        ordered: List[str] = []
+        singles: List[str] = []
+        seen = set()
+        for user_id, session in self.active_connections.items():
+            if user_id in seen:
+                continue
+            seen.add(user_id)
+            partner_id = session.partner_id
+            if partner_id and partner_id in self.active_connections and partner_id not in seen:
+                seen.add(partner_id)
+                ordered += (user_id, partner_id)
+            else:
+                singles.append(user_id)
+        ordered += singles
+
+        for start in range(0, len(ordered), batch_size):
+            batch = ordered[start:start + batch_size]
+            # Разносим переподключения во времени, чтобы не было "грохочущего стада"
+            reconnect_after = round(random.uniform(0, reconnect_jitter), 2)
+            await self.close_for_restart(batch, reconnect_after)
+            logging.info(f"Drained {min(start + batch_size, len(ordered))}/{len(ordered)} connections")
+            if start + batch_size < len(ordered):
+                await asyncio.sleep(batch_interval)
+
+    async def close_for_restart(self, user_ids: List[str], reconnect_after: float = 0.0):
+        """Сообщаем клиентам о перезапуске и закрываем их сокеты"""
+        # Клиент восстанавливает сессию по токену из connection_established, поэтому кадр общий для всей пачки
+        await self.broadcast(messages.server_draining(reconnect_after), user_ids)
+        for user_id in user_ids:
+            session = self.get_session(user_id)
+            if session is None:
+                continue
+            try:
+                await session.websocket.close(code=SERVICE_RESTART_CODE)
+            except Exception as e:
+                logging.debug(f"Failed to close {user_id} during drain: {e}")
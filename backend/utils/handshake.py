@@ -0,0 +1,187 @@
+import functools
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional, Pattern, Sequence
+
+from .iso_codes import ISO_COUNTRIES, ISO_LANGUAGES
+
+# Код закрытия WebSocket "Policy Violation" (RFC 6455) для некорректного первого кадра
+POLICY_VIOLATION_CODE = 1008
+# Ограничения полей первого кадра клиента
+MAX_NAME_LENGTH = 64
+MAX_RESUME_TOKEN_LENGTH = 64
+# Сколько значений не из таблиц ISO регистрирует intern (симулятор, тесты); клиентам это недоступно
+MAX_DYNAMIC_ENTRIES = 1024
+
+# Варианты написания сверх ISO 3166-1 (сравниваются без учета регистра и пробелов)
+COUNTRY_ALIASES: Dict[str, Sequence[str]] = {
+    "Russia": ("россия",),
+    "USA": ("america",),
+    "UK": ("great britain", "britain"),
+    "Germany": ("deutschland",),
+    "Brazil": ("brasil",),
+    "Türkiye": ("turkey",),
+    "Côte d'Ivoire": ("ivory coast", "cote d'ivoire"),
+    "Cabo Verde": ("cape verde",),
+    "Czechia": ("czech",),
+    "Eswatini": ("swaziland",),
+    "Myanmar": ("burma",),
+    "Brunei Darussalam": ("brunei",),
+    "North Macedonia": ("macedonia",),
+    "Vatican City": ("holy see", "vatican"),
+}
+
+# Варианты написания языков сверх ISO 639
+LANGUAGE_ALIASES: Dict[str, Sequence[str]] = {
+    "ru": ("русский",),
+    "de": ("deutsch",),
+}
+
+# Буквы любого алфавита, пробелы, точки, дефисы и апострофы
+_COUNTRY_RE = re.compile(r"(?:[^\W\d_]|[ .'-])+")
+# Код языка в духе BCP 47: "en", "pt-br", "zh_hant"
+_LANGUAGE_RE = re.compile(r"[a-z]{2,8}(?:[-_][a-z0-9]{1,8})*")
+
+
+class HandshakeError(ValueError):
+    """Первый кадр клиента не соответствует схеме"""
+
+
+def _collapse(value: str) -> str:
+    return " ".join(value.split())
+
+
+class Vocabulary:
+    """Таблица канонических значений: вариант написания -> небольшой целый ID.
+
+    ID 0 зарезервирован за "не указано". Значения от клиентов (lookup) принимаются
+    только из таблицы. Внутренние источники - симулятор со своими трассами, тесты -
+    могут зарегистрировать новое значение через intern (не больше MAX_DYNAMIC_ENTRIES).
+    """
+
+    def __init__(self, kind: str, pattern: Pattern, *alias_tables: Dict[str, Sequence[str]]):
+        self.kind = kind
+        self.names: List[Optional[str]] = [None]
+        self._ids: Dict[str, int] = {}
+        self._pattern = pattern
+        self._dynamic = 0
+        self._lock = threading.Lock()
+        for aliases in alias_tables:
+            for name, variants in aliases.items():
+                entry_id = self._ids.get(name.casefold())
+                if entry_id is None:
+                    entry_id = self._add(name)
+                for variant in variants:
+                    self._ids[_collapse(variant).casefold()] = entry_id
+
+    def _add(self, name: str) -> int:
+        self.names.append(name)
+        self._ids[name.casefold()] = len(self.names) - 1
+        return len(self.names) - 1
+
+    def _key(self, value: str) -> str:
+        return _collapse(value).casefold()
+
+    def lookup(self, value: Any) -> int:
+        """ID значения из таблицы; HandshakeError, если значение некорректно или неизвестно"""
+        if value is None:
+            return 0
+        if not isinstance(value, str):
+            raise HandshakeError(f"{self.kind} must be a string")
+        entry_id = self._ids.get(self._key(value))
+        if entry_id is None:
+            raise HandshakeError(f"Unknown {self.kind}: {value[:MAX_NAME_LENGTH]!r}")
+        return entry_id
+
+    def intern(self, value: Any) -> int:
+        """Как lookup, но незнакомое корректное значение регистрируется (только для доверенных данных)"""
+        if value is None:
+            return 0
+        if not isinstance(value, str):
+            raise HandshakeError(f"{self.kind} must be a string")
+        key = self._key(value)
+        entry_id = self._ids.get(key)
+        if entry_id is not None:
+            return entry_id
+        if not key or len(key) > MAX_NAME_LENGTH or not self._pattern.fullmatch(key):
+            raise HandshakeError(f"Invalid {self.kind}: {value[:MAX_NAME_LENGTH]!r}")
+
+        with self._lock:
+            entry_id = self._ids.get(key)
+            if entry_id is None:
+                if self._dynamic >= MAX_DYNAMIC_ENTRIES:
+                    raise HandshakeError(f"Unknown {self.kind}: {value[:MAX_NAME_LENGTH]!r}")
+                entry_id = self._add(self._canonical(value, key))
+                self._ids[key] = entry_id
+                self._dynamic += 1
+        return entry_id
+
+    def _canonical(self, value: str, key: str) -> str:
+        return _collapse(value)
+
+    def name(self, entry_id: int) -> Optional[str]:
+        return self.names[entry_id]
+
+
+class _LanguageVocabulary(Vocabulary):
+    def _key(self, value: str) -> str:
+        key = super()._key(value)
+        # "en-US" и "en_GB" - это "en": подбор пар учитывает только основной язык
+        if key not in self._ids and self._pattern.fullmatch(key):
+            key = re.split(r"[-_]", key, 1)[0]
+        return key
+
+    def _canonical(self, value: str, key: str) -> str:
+        return key
+
+
+COUNTRIES = Vocabulary("country", _COUNTRY_RE, ISO_COUNTRIES, COUNTRY_ALIASES)
+LANGUAGES = _LanguageVocabulary("language", _LANGUAGE_RE, ISO_LANGUAGES, LANGUAGE_ALIASES)
+
+
+# Клиенты присылают одни и те же строки - разбор каждой делаем один раз
+@functools.lru_cache(maxsize=4096)
+def country_id(value: Optional[str]) -> int:
+    return COUNTRIES.lookup(value)
+
+
+@functools.lru_cache(maxsize=4096)
+def language_id(value: Optional[str]) -> int:
+    return LANGUAGES.lookup(value)
+
+
+def parse_handshake(data: str) -> Dict[str, Any]:
+    """Проверяем первый кадр клиента и приводим страну и язык к каноническому виду"""
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        raise HandshakeError("Handshake must be a JSON object") from None
+    if not isinstance(payload, dict):
+        raise HandshakeError("Handshake must be a JSON object")
+
+    country = payload.get("country")
+    if not isinstance(country, str) or not country.strip():
+        raise HandshakeError("country is required")
+    language = payload.get("language")
+    if language is not None and not isinstance(language, str):
+        raise HandshakeError("language must be a string")
+    batching = payload.get("batching", False)
+    if not isinstance(batching, bool):
+        raise HandshakeError("batching must be true or false")
+    resume_token = payload.get("resume_token")
+    if resume_token is not None and (not isinstance(resume_token, str) or len(resume_token) > MAX_RESUME_TOKEN_LENGTH):
+        raise HandshakeError("Invalid resume_token")
+
+    cid = country_id(country)
+    lid = language_id(language)
+    user_data = {
+        "country": COUNTRIES.name(cid),
+        "country_id": cid,
+        "language": LANGUAGES.name(lid),
+        "language_id": lid,
+        "batching": batching,
+    }
+    if resume_token:
+        user_data["resume_token"] = resume_token
+    return user_data
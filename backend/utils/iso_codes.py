@@ -0,0 +1,446 @@
+from typing import Dict, Sequence
+
+# Таблицы построены по ISO 3166-1 и ISO 639-1 (данные пакета iso-codes).
+# Для нескольких стран каноническое название короче официального ("Russia", "USA", "UK"):
+# его клиенты видят в match_found.
+
+# Каноническое название страны -> alpha-2, alpha-3 и названия из ISO 3166-1
+ISO_COUNTRIES: Dict[str, Sequence[str]] = {
+    "Andorra": ("ad", "and", "principality of andorra"),
+    "United Arab Emirates": ("ae", "are"),
+    "Afghanistan": ("af", "afg", "islamic republic of afghanistan"),
+    "Antigua and Barbuda": ("ag", "atg"),
+    "Anguilla": ("ai", "aia"),
+    "Albania": ("al", "alb", "republic of albania"),
+    "Armenia": ("am", "arm", "republic of armenia"),
+    "Angola": ("ao", "ago", "republic of angola"),
+    "Antarctica": ("aq", "ata"),
+    "Argentina": ("ar", "arg", "argentine republic"),
+    "American Samoa": ("as", "asm"),
+    "Austria": ("at", "aut", "republic of austria"),
+    "Australia": ("au", "aus"),
+    "Aruba": ("aw", "abw"),
+    "Åland Islands": ("ax", "ala"),
+    "Azerbaijan": ("az", "aze", "republic of azerbaijan"),
+    "Bosnia and Herzegovina": ("ba", "bih", "republic of bosnia and herzegovina"),
+    "Barbados": ("bb", "brb"),
+    "Bangladesh": ("bd", "bgd", "people's republic of bangladesh"),
+    "Belgium": ("be", "bel", "kingdom of belgium"),
+    "Burkina Faso": ("bf", "bfa"),
+    "Bulgaria": ("bg", "bgr", "republic of bulgaria"),
+    "Bahrain": ("bh", "bhr", "kingdom of bahrain"),
+    "Burundi": ("bi", "bdi", "republic of burundi"),
+    "Benin": ("bj", "ben", "republic of benin"),
+    "Saint Barthélemy": ("bl", "blm"),
+    "Bermuda": ("bm", "bmu"),
+    "Brunei Darussalam": ("bn", "brn"),
+    "Bolivia": ("bo", "bol", "bolivia, plurinational state of", "plurinational state of bolivia"),
+    "Bonaire, Sint Eustatius and Saba": ("bq", "bes"),
+    "Brazil": ("br", "bra", "federative republic of brazil"),
+    "Bahamas": ("bs", "bhs", "commonwealth of the bahamas"),
+    "Bhutan": ("bt", "btn", "kingdom of bhutan"),
+    "Bouvet Island": ("bv", "bvt"),
+    "Botswana": ("bw", "bwa", "republic of botswana"),
+    "Belarus": ("by", "blr", "republic of belarus"),
+    "Belize": ("bz", "blz"),
+    "Canada": ("ca", "can"),
+    "Cocos (Keeling) Islands": ("cc", "cck"),
+    "DR Congo": ("cd", "cod", "congo, the democratic republic of the"),
+    "Central African Republic": ("cf", "caf"),
+    "Congo": ("cg", "cog", "republic of the congo"),
+    "Switzerland": ("ch", "che", "swiss confederation"),
+    "Côte d'Ivoire": ("ci", "civ", "republic of côte d'ivoire"),
+    "Cook Islands": ("ck", "cok"),
+    "Chile": ("cl", "chl", "republic of chile"),
+    "Cameroon": ("cm", "cmr", "republic of cameroon"),
+    "China": ("cn", "chn", "people's republic of china"),
+    "Colombia": ("co", "col", "republic of colombia"),
+    "Costa Rica": ("cr", "cri", "republic of costa rica"),
+    "Cuba": ("cu", "cub", "republic of cuba"),
+    "Cabo Verde": ("cv", "cpv", "republic of cabo verde"),
+    "Curaçao": ("cw", "cuw"),
+    "Christmas Island": ("cx", "cxr"),
+    "Cyprus": ("cy", "cyp", "republic of cyprus"),
+    "Czechia": ("cz", "cze", "czech republic"),
+    "Germany": ("de", "deu", "federal republic of germany"),
+    "Djibouti": ("dj", "dji", "republic of djibouti"),
+    "Denmark": ("dk", "dnk", "kingdom of denmark"),
+    "Dominica": ("dm", "dma", "commonwealth of dominica"),
+    "Dominican Republic": ("do", "dom"),
+    "Algeria": ("dz", "dza", "people's democratic republic of algeria"),
+    "Ecuador": ("ec", "ecu", "republic of ecuador"),
+    "Estonia": ("ee", "est", "republic of estonia"),
+    "Egypt": ("eg", "egy", "arab republic of egypt"),
+    "Western Sahara": ("eh", "esh"),
+    "Eritrea": ("er", "eri", "the state of eritrea"),
+    "Spain": ("es", "esp", "kingdom of spain"),
+    "Ethiopia": ("et", "eth", "federal democratic republic of ethiopia"),
+    "Finland": ("fi", "fin", "republic of finland"),
+    "Fiji": ("fj", "fji", "republic of fiji"),
+    "Falkland Islands (Malvinas)": ("fk", "flk"),
+    "Micronesia": ("fm", "fsm", "micronesia, federated states of", "federated states of micronesia"),
+    "Faroe Islands": ("fo", "fro"),
+    "France": ("fr", "fra", "french republic"),
+    "Gabon": ("ga", "gab", "gabonese republic"),
+    "UK": ("gb", "gbr", "united kingdom", "united kingdom of great britain and northern ireland"),
+    "Grenada": ("gd", "grd"),
+    "Georgia": ("ge", "geo"),
+    "French Guiana": ("gf", "guf"),
+    "Guernsey": ("gg", "ggy"),
+    "Ghana": ("gh", "gha", "republic of ghana"),
+    "Gibraltar": ("gi", "gib"),
+    "Greenland": ("gl", "grl"),
+    "Gambia": ("gm", "gmb", "republic of the gambia"),
+    "Guinea": ("gn", "gin", "republic of guinea"),
+    "Guadeloupe": ("gp", "glp"),
+    "Equatorial Guinea": ("gq", "gnq", "republic of equatorial guinea"),
+    "Greece": ("gr", "grc", "hellenic republic"),
+    "South Georgia and the South Sandwich Islands": ("gs", "sgs"),
+    "Guatemala": ("gt", "gtm", "republic of guatemala"),
+    "Guam": ("gu", "gum"),
+    "Guinea-Bissau": ("gw", "gnb", "republic of guinea-bissau"),
+    "Guyana": ("gy", "guy", "republic of guyana"),
+    "Hong Kong": ("hk", "hkg", "hong kong special administrative region of china"),
+    "Heard Island and McDonald Islands": ("hm", "hmd"),
+    "Honduras": ("hn", "hnd", "republic of honduras"),
+    "Croatia": ("hr", "hrv", "republic of croatia"),
+    "Haiti": ("ht", "hti", "republic of haiti"),
+    "Hungary": ("hu", "hun"),
+    "Indonesia": ("id", "idn", "republic of indonesia"),
+    "Ireland": ("ie", "irl"),
+    "Israel": ("il", "isr", "state of israel"),
+    "Isle of Man": ("im", "imn"),
+    "India": ("in", "ind", "republic of india"),
+    "British Indian Ocean Territory": ("io", "iot"),
+    "Iraq": ("iq", "irq", "republic of iraq"),
+    "Iran": ("ir", "irn", "iran, islamic republic of", "islamic republic of iran"),
+    "Iceland": ("is", "isl", "republic of iceland"),
+    "Italy": ("it", "ita", "italian republic"),
+    "Jersey": ("je", "jey"),
+    "Jamaica": ("jm", "jam"),
+    "Jordan": ("jo", "jor", "hashemite kingdom of jordan"),
+    "Japan": ("jp", "jpn"),
+    "Kenya": ("ke", "ken", "republic of kenya"),
+    "Kyrgyzstan": ("kg", "kgz", "kyrgyz republic"),
+    "Cambodia": ("kh", "khm", "kingdom of cambodia"),
+    "Kiribati": ("ki", "kir", "republic of kiribati"),
+    "Comoros": ("km", "com", "union of the comoros"),
+    "Saint Kitts and Nevis": ("kn", "kna"),
+    "North Korea": ("kp", "prk", "korea, democratic people's republic of", "democratic people's republic of korea"),
+    "South Korea": ("kr", "kor", "korea, republic of"),
+    "Kuwait": ("kw", "kwt", "state of kuwait"),
+    "Cayman Islands": ("ky", "cym"),
+    "Kazakhstan": ("kz", "kaz", "republic of kazakhstan"),
+    "Laos": ("la", "lao", "lao people's democratic republic"),
+    "Lebanon": ("lb", "lbn", "lebanese republic"),
+    "Saint Lucia": ("lc", "lca"),
+    "Liechtenstein": ("li", "lie", "principality of liechtenstein"),
+    "Sri Lanka": ("lk", "lka", "democratic socialist republic of sri lanka"),
+    "Liberia": ("lr", "lbr", "republic of liberia"),
+    "Lesotho": ("ls", "lso", "kingdom of lesotho"),
+    "Lithuania": ("lt", "ltu", "republic of lithuania"),
+    "Luxembourg": ("lu", "lux", "grand duchy of luxembourg"),
+    "Latvia": ("lv", "lva", "republic of latvia"),
+    "Libya": ("ly", "lby"),
+    "Morocco": ("ma", "mar", "kingdom of morocco"),
+    "Monaco": ("mc", "mco", "principality of monaco"),
+    "Moldova": ("md", "mda", "moldova, republic of", "republic of moldova"),
+    "Montenegro": ("me", "mne"),
+    "Saint Martin (French part)": ("mf", "maf"),
+    "Madagascar": ("mg", "mdg", "republic of madagascar"),
+    "Marshall Islands": ("mh", "mhl", "republic of the marshall islands"),
+    "North Macedonia": ("mk", "mkd", "republic of north macedonia"),
+    "Mali": ("ml", "mli", "republic of mali"),
+    "Myanmar": ("mm", "mmr", "republic of myanmar"),
+    "Mongolia": ("mn", "mng"),
+    "Macao": ("mo", "mac", "macao special administrative region of china"),
+    "Northern Mariana Islands": ("mp", "mnp", "commonwealth of the northern mariana islands"),
+    "Martinique": ("mq", "mtq"),
+    "Mauritania": ("mr", "mrt", "islamic republic of mauritania"),
+    "Montserrat": ("ms", "msr"),
+    "Malta": ("mt", "mlt", "republic of malta"),
+    "Mauritius": ("mu", "mus", "republic of mauritius"),
+    "Maldives": ("mv", "mdv", "republic of maldives"),
+    "Malawi": ("mw", "mwi", "republic of malawi"),
+    "Mexico": ("mx", "mex", "united mexican states"),
+    "Malaysia": ("my", "mys"),
+    "Mozambique": ("mz", "moz", "republic of mozambique"),
+    "Namibia": ("na", "nam", "republic of namibia"),
+    "New Caledonia": ("nc", "ncl"),
+    "Niger": ("ne", "ner", "republic of the niger"),
+    "Norfolk Island": ("nf", "nfk"),
+    "Nigeria": ("ng", "nga", "federal republic of nigeria"),
+    "Nicaragua": ("ni", "nic", "republic of nicaragua"),
+    "Netherlands": ("nl", "nld", "kingdom of the netherlands"),
+    "Norway": ("no", "nor", "kingdom of norway"),
+    "Nepal": ("np", "npl", "federal democratic republic of nepal"),
+    "Nauru": ("nr", "nru", "republic of nauru"),
+    "Niue": ("nu", "niu"),
+    "New Zealand": ("nz", "nzl"),
+    "Oman": ("om", "omn", "sultanate of oman"),
+    "Panama": ("pa", "pan", "republic of panama"),
+    "Peru": ("pe", "per", "republic of peru"),
+    "French Polynesia": ("pf", "pyf"),
+    "Papua New Guinea": ("pg", "png", "independent state of papua new guinea"),
+    "Philippines": ("ph", "phl", "republic of the philippines"),
+    "Pakistan": ("pk", "pak", "islamic republic of pakistan"),
+    "Poland": ("pl", "pol", "republic of poland"),
+    "Saint Pierre and Miquelon": ("pm", "spm"),
+    "Pitcairn": ("pn", "pcn"),
+    "Puerto Rico": ("pr", "pri"),
+    "Palestine": ("ps", "pse", "palestine, state of", "the state of palestine"),
+    "Portugal": ("pt", "prt", "portuguese republic"),
+    "Palau": ("pw", "plw", "republic of palau"),
+    "Paraguay": ("py", "pry", "republic of paraguay"),
+    "Qatar": ("qa", "qat", "state of qatar"),
+    "Réunion": ("re", "reu"),
+    "Romania": ("ro", "rou"),
+    "Serbia": ("rs", "srb", "republic of serbia"),
+    "Russia": ("ru", "rus", "russian federation"),
+    "Rwanda": ("rw", "rwa", "rwandese republic"),
+    "Saudi Arabia": ("sa", "sau", "kingdom of saudi arabia"),
+    "Solomon Islands": ("sb", "slb"),
+    "Seychelles": ("sc", "syc", "republic of seychelles"),
+    "Sudan": ("sd", "sdn", "republic of the sudan"),
+    "Sweden": ("se", "swe", "kingdom of sweden"),
+    "Singapore": ("sg", "sgp", "republic of singapore"),
+    "Saint Helena, Ascension and Tristan da Cunha": ("sh", "shn"),
+    "Slovenia": ("si", "svn", "republic of slovenia"),
+    "Svalbard and Jan Mayen": ("sj", "sjm"),
+    "Slovakia": ("sk", "svk", "slovak republic"),
+    "Sierra Leone": ("sl", "sle", "republic of sierra leone"),
+    "San Marino": ("sm", "smr", "republic of san marino"),
+    "Senegal": ("sn", "sen", "republic of senegal"),
+    "Somalia": ("so", "som", "federal republic of somalia"),
+    "Suriname": ("sr", "sur", "republic of suriname"),
+    "South Sudan": ("ss", "ssd", "republic of south sudan"),
+    "Sao Tome and Principe": ("st", "stp", "democratic republic of sao tome and principe"),
+    "El Salvador": ("sv", "slv", "republic of el salvador"),
+    "Sint Maarten (Dutch part)": ("sx", "sxm"),
+    "Syria": ("sy", "syr", "syrian arab republic"),
+    "Eswatini": ("sz", "swz", "kingdom of eswatini"),
+    "Turks and Caicos Islands": ("tc", "tca"),
+    "Chad": ("td", "tcd", "republic of chad"),
+    "French Southern Territories": ("tf", "atf"),
+    "Togo": ("tg", "tgo", "togolese republic"),
+    "Thailand": ("th", "tha", "kingdom of thailand"),
+    "Tajikistan": ("tj", "tjk", "republic of tajikistan"),
+    "Tokelau": ("tk", "tkl"),
+    "Timor-Leste": ("tl", "tls", "democratic republic of timor-leste"),
+    "Turkmenistan": ("tm", "tkm"),
+    "Tunisia": ("tn", "tun", "republic of tunisia"),
+    "Tonga": ("to", "ton", "kingdom of tonga"),
+    "Türkiye": ("tr", "tur", "republic of türkiye"),
+    "Trinidad and Tobago": ("tt", "tto", "republic of trinidad and tobago"),
+    "Tuvalu": ("tv", "tuv"),
+    "Taiwan": ("tw", "twn", "taiwan, province of china"),
+    "Tanzania": ("tz", "tza", "tanzania, united republic of", "united republic of tanzania"),
+    "Ukraine": ("ua", "ukr"),
+    "Uganda": ("ug", "uga", "republic of uganda"),
+    "United States Minor Outlying Islands": ("um", "umi"),
+    "USA": ("us", "united states", "united states of america"),
+    "Uruguay": ("uy", "ury", "eastern republic of uruguay"),
+    "Uzbekistan": ("uz", "uzb", "republic of uzbekistan"),
+    "Vatican City": ("va", "vat", "holy see (vatican city state)"),
+    "Saint Vincent and the Grenadines": ("vc", "vct"),
+    "Venezuela": ("ve", "ven", "venezuela, bolivarian republic of", "bolivarian republic of venezuela"),
+    "British Virgin Islands": ("vg", "vgb", "virgin islands, british"),
+    "US Virgin Islands": ("vi", "vir", "virgin islands, u.s.", "virgin islands of the united states"),
+    "Vietnam": ("vn", "vnm", "viet nam", "socialist republic of viet nam"),
+    "Vanuatu": ("vu", "vut", "republic of vanuatu"),
+    "Wallis and Futuna": ("wf", "wlf"),
+    "Samoa": ("ws", "wsm", "independent state of samoa"),
+    "Yemen": ("ye", "yem", "republic of yemen"),
+    "Mayotte": ("yt", "myt"),
+    "South Africa": ("za", "zaf", "republic of south africa"),
+    "Zambia": ("zm", "zmb", "republic of zambia"),
+    "Zimbabwe": ("zw", "zwe", "republic of zimbabwe"),
+}
+
+# Код языка ISO 639-1 -> коды ISO 639-2 и английские названия
+ISO_LANGUAGES: Dict[str, Sequence[str]] = {
+    "aa": ("aar", "afar"),
+    "ab": ("abk", "abkhazian"),
+    "ae": ("ave", "avestan"),
+    "af": ("afr", "afrikaans"),
+    "ak": ("aka", "akan"),
+    "am": ("amh", "amharic"),
+    "an": ("arg", "aragonese"),
+    "ar": ("ara", "arabic"),
+    "as": ("asm", "assamese"),
+    "av": ("ava", "avaric"),
+    "ay": ("aym", "aymara"),
+    "az": ("aze", "azerbaijani"),
+    "ba": ("bak", "bashkir"),
+    "be": ("bel", "belarusian"),
+    "bg": ("bul", "bulgarian"),
+    "bh": ("bih", "bihari languages"),
+    "bi": ("bis", "bislama"),
+    "bm": ("bam", "bambara"),
+    "bn": ("ben", "bengali"),
+    "bo": ("bod", "tib", "tibetan"),
+    "br": ("bre", "breton"),
+    "bs": ("bos", "bosnian"),
+    "ca": ("cat", "catalan", "valencian"),
+    "ce": ("che", "chechen"),
+    "ch": ("cha", "chamorro"),
+    "co": ("cos", "corsican"),
+    "cr": ("cre", "cree"),
+    "cs": ("ces", "cze", "czech"),
+    "cu": ("chu", "church slavic", "old slavonic", "church slavonic", "old bulgarian", "old church slavonic"),
+    "cv": ("chv", "chuvash"),
+    "cy": ("cym", "wel", "welsh"),
+    "da": ("dan", "danish"),
+    "de": ("deu", "ger", "german"),
+    "dv": ("div", "divehi", "dhivehi", "maldivian"),
+    "dz": ("dzo", "dzongkha"),
+    "ee": ("ewe",),
+    "el": ("ell", "gre", "modern greek", "greek"),
+    "en": ("eng", "english"),
+    "eo": ("epo", "esperanto"),
+    "es": ("spa", "spanish", "castilian"),
+    "et": ("est", "estonian"),
+    "eu": ("eus", "baq", "basque"),
+    "fa": ("fas", "per", "persian"),
+    "ff": ("ful", "fulah"),
+    "fi": ("fin", "finnish"),
+    "fj": ("fij", "fijian"),
+    "fo": ("fao", "faroese"),
+    "fr": ("fra", "fre", "french"),
+    "fy": ("fry", "western frisian"),
+    "ga": ("gle", "irish"),
+    "gd": ("gla", "gaelic", "scottish gaelic"),
+    "gl": ("glg", "galician"),
+    "gn": ("grn", "guarani"),
+    "gu": ("guj", "gujarati"),
+    "gv": ("glv", "manx"),
+    "ha": ("hau", "hausa"),
+    "he": ("heb", "hebrew"),
+    "hi": ("hin", "hindi"),
+    "ho": ("hmo", "hiri motu"),
+    "hr": ("hrv", "croatian"),
+    "ht": ("hat", "haitian", "haitian creole"),
+    "hu": ("hun", "hungarian"),
+    "hy": ("hye", "arm", "armenian"),
+    "hz": ("her", "herero"),
+    "ia": ("ina", "interlingua"),
+    "id": ("ind", "indonesian"),
+    "ie": ("ile", "interlingue", "occidental"),
+    "ig": ("ibo", "igbo"),
+    "ii": ("iii", "sichuan yi", "nuosu"),
+    "ik": ("ipk", "inupiaq"),
+    "io": ("ido",),
+    "is": ("isl", "ice", "icelandic"),
+    "it": ("ita", "italian"),
+    "iu": ("iku", "inuktitut"),
+    "ja": ("jpn", "japanese"),
+    "jv": ("jav", "javanese"),
+    "ka": ("kat", "geo", "georgian"),
+    "kg": ("kon", "kongo"),
+    "ki": ("kik", "kikuyu", "gikuyu"),
+    "kj": ("kua", "kuanyama", "kwanyama"),
+    "kk": ("kaz", "kazakh"),
+    "kl": ("kal", "kalaallisut", "greenlandic"),
+    "km": ("khm", "central khmer"),
+    "kn": ("kan", "kannada"),
+    "ko": ("kor", "korean"),
+    "kr": ("kau", "kanuri"),
+    "ks": ("kas", "kashmiri"),
+    "ku": ("kur", "kurdish"),
+    "kv": ("kom", "komi"),
+    "kw": ("cor", "cornish"),
+    "ky": ("kir", "kirghiz", "kyrgyz"),
+    "la": ("lat", "latin"),
+    "lb": ("ltz", "luxembourgish", "letzeburgesch"),
+    "lg": ("lug", "ganda"),
+    "li": ("lim", "limburgan", "limburger", "limburgish"),
+    "ln": ("lin", "lingala"),
+    "lo": ("lao",),
+    "lt": ("lit", "lithuanian"),
+    "lu": ("lub", "luba-katanga"),
+    "lv": ("lav", "latvian"),
+    "mg": ("mlg", "malagasy"),
+    "mh": ("mah", "marshallese"),
+    "mi": ("mri", "mao", "maori"),
+    "mk": ("mkd", "mac", "macedonian"),
+    "ml": ("mal", "malayalam"),
+    "mn": ("mon", "mongolian"),
+    "mr": ("mar", "marathi"),
+    "ms": ("msa", "may", "malay"),
+    "mt": ("mlt", "maltese"),
+    "my": ("mya", "bur", "burmese"),
+    "na": ("nau", "nauru"),
+    "nb": ("nob", "norwegian bokmål"),
+    "nd": ("nde", "north ndebele"),
+    "ne": ("nep", "nepali"),
+    "ng": ("ndo", "ndonga"),
+    "nl": ("nld", "dut", "dutch", "flemish"),
+    "nn": ("nno", "norwegian nynorsk"),
+    "no": ("nor", "norwegian"),
+    "nr": ("nbl", "south ndebele"),
+    "nv": ("nav", "navajo", "navaho"),
+    "ny": ("nya", "chichewa", "chewa", "nyanja"),
+    "oc": ("oci", "occitan", "provençal"),
+    "oj": ("oji", "ojibwa"),
+    "om": ("orm", "oromo"),
+    "or": ("ori", "oriya"),
+    "os": ("oss", "ossetian", "ossetic"),
+    "pa": ("pan", "panjabi", "punjabi"),
+    "pi": ("pli", "pali"),
+    "pl": ("pol", "polish"),
+    "ps": ("pus", "pushto", "pashto"),
+    "pt": ("por", "portuguese"),
+    "qu": ("que", "quechua"),
+    "rm": ("roh", "romansh"),
+    "rn": ("run", "rundi"),
+    "ro": ("ron", "rum", "romanian", "moldavian", "moldovan"),
+    "ru": ("rus", "russian"),
+    "rw": ("kin", "kinyarwanda"),
+    "sa": ("san", "sanskrit"),
+    "sc": ("srd", "sardinian"),
+    "sd": ("snd", "sindhi"),
+    "se": ("sme", "northern sami"),
+    "sg": ("sag", "sango"),
+    "si": ("sin", "sinhala", "sinhalese"),
+    "sk": ("slk", "slo", "slovak"),
+    "sl": ("slv", "slovenian"),
+    "sm": ("smo", "samoan"),
+    "sn": ("sna", "shona"),
+    "so": ("som", "somali"),
+    "sq": ("sqi", "alb", "albanian"),
+    "sr": ("srp", "serbian"),
+    "ss": ("ssw", "swati"),
+    "st": ("sot", "southern sotho"),
+    "su": ("sun", "sundanese"),
+    "sv": ("swe", "swedish"),
+    "sw": ("swa", "swahili"),
+    "ta": ("tam", "tamil"),
+    "te": ("tel", "telugu"),
+    "tg": ("tgk", "tajik"),
+    "th": ("tha", "thai"),
+    "ti": ("tir", "tigrinya"),
+    "tk": ("tuk", "turkmen"),
+    "tl": ("tgl", "tagalog"),
+    "tn": ("tsn", "tswana"),
+    "to": ("ton", "tonga"),
+    "tr": ("tur", "turkish"),
+    "ts": ("tso", "tsonga"),
+    "tt": ("tat", "tatar"),
+    "tw": ("twi",),
+    "ty": ("tah", "tahitian"),
+    "ug": ("uig", "uighur", "uyghur"),
+    "uk": ("ukr", "ukrainian"),
+    "ur": ("urd", "urdu"),
+    "uz": ("uzb", "uzbek"),
+    "ve": ("ven", "venda"),
+    "vi": ("vie", "vietnamese"),
+    "vo": ("vol", "volapük"),
+    "wa": ("wln", "walloon"),
+    "wo": ("wol", "wolof"),
+    "xh": ("xho", "xhosa"),
+    "yi": ("yid", "yiddish"),
+    "yo": ("yor", "yoruba"),
+    "za": ("zha", "zhuang", "chuang"),
+    "zh": ("zho", "chi", "chinese"),
+    "zu": ("zul", "zulu"),
+}
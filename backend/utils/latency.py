@@ -0,0 +1,93 @@
+import bisect
+import math
+from typing import Any, Dict, List
+
+# Границы корзин гистограммы в секундах: от 0.1 мс, каждая следующая в 2 раза больше (~1.6 ч)
+BUCKET_BOUNDS: List[float] = [0.0001 * 2 ** i for i in range(26)]
+# Метки времени клиента дальше этого от часов сервера считаем подделкой или сбоем, секунды
+MAX_CLOCK_SKEW = 300.0
+
+
+def is_finite_number(value: Any) -> bool:
+    # json.loads пропускает NaN и Infinity, а bool - подкласс int
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def is_plausible_timestamp(value: Any, now: float) -> bool:
+    """Метка времени (секунды Unix) из кадра клиента, которую можно учитывать и пересылать"""
+    return is_finite_number(value) and abs(value - now) <= MAX_CLOCK_SKEW
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с логарифмическими корзинами и фиксированной памятью"""
+
+    __slots__ = ("counts", "count", "total", "min", "max", "negative")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        # Отрицательные значения - признак рассинхронизации часов клиента и сервера
+        self.negative = 0
+
+    def record(self, seconds: float):
+        if not math.isfinite(seconds):
+            return
+        if seconds < 0:
+            self.negative += 1
+            seconds = 0.0
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        """Оценка перцентиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return min(BUCKET_BOUNDS[i], self.max) if i < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3),
+            "min_ms": round(self.min * 1000, 3),
+            "p50_ms": round(self.percentile(50) * 1000, 3),
+            "p95_ms": round(self.percentile(95) * 1000, 3),
+            "p99_ms": round(self.percentile(99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "negative": self.negative,
+        }
+
+
+class LatencyTracker:
+    """Гистограммы задержек по участкам пути сообщения"""
+
+    # Участки пути chat_message от отправителя до получателя
+    CLIENT_TO_SERVER = "client_to_server"  # client_ts -> прием сервером (разные часы)
+    SERVER_QUEUE = "server_queue"  # прием -> отправка партнеру (часы сервера)
+    SERVER_TO_CLIENT = "server_to_client"  # отправка -> прием получателем (разные часы)
+    DELIVERY_ROUNDTRIP = "delivery_roundtrip"  # отправка партнеру -> его ack на сервере (часы сервера)
+
+    def __init__(self):
+        self.hops: Dict[str, LatencyHistogram] = {}
+
+    def record(self, hop: str, seconds: float):
+        histogram = self.hops.get(hop)
+        if histogram is None:
+            histogram = self.hops[hop] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {hop: histogram.snapshot() for hop, histogram in self.hops.items()}
@@ -0,0 +1,170 @@
+import json
+import re
+from typing import Any, Dict, Sequence
+
+# Быстрое кодирование строки в JSON (C-реализация, тот же результат что json.dumps)
+_encode_string = json.encoder.encode_basestring_ascii
+_SLOT = "@@slot:{}@@"
+_SLOT_RE = re.compile(r'"@@slot:(\w+)@@"')
+
+
+def _encode_value(value: Any) -> str:
+    """Кодируем значение переменного поля"""
+    if isinstance(value, str):
+        return _encode_string(value)
+    return json.dumps(value)
+
+
+class MessageTemplate:
+    """Предкодированный JSON-кадр, в который подставляются переменные поля"""
+
+    __slots__ = ("_parts", "_fields")
+
+    def __init__(self, payload: Dict[str, Any], fields: Sequence[str]):
+        marked = dict(payload)
+        for field in fields:
+            marked[field] = _SLOT.format(field)
+
+        # Разрезаем закодированный кадр на постоянные куски между слотами
+        encoded = json.dumps(marked)
+        pieces = _SLOT_RE.split(encoded)
+        self._parts = tuple(pieces[0::2])
+        self._fields = tuple(pieces[1::2])
+
+    def render(self, **values: Any) -> str:
+        """Собираем кадр, подставляя значения переменных полей"""
+        parts = self._parts
+        chunks = [parts[0]]
+        for i, field in enumerate(self._fields):
+            chunks.append(_encode_value(values[field]))
+            chunks.append(parts[i + 1])
+        return "".join(chunks)
+
+
+# Постоянные кадры - кодируются один раз при импорте
+PARTNER_DISCONNECTED = json.dumps({
+    "type": "partner_disconnected",
+    "message": "Your conversation partner has disconnected"
+})
+
+STILL_WAITING_ERROR = json.dumps({
+    "type": "error",
+    "message": "You are still waiting for a partner"
+})
+
+# Шаблоны кадров с переменными полями
+_CONNECTION_ESTABLISHED = MessageTemplate({
+    "type": "connection_established",
+    "user_id": None,
+    "message": "Successfully connected to Bridge server",
+    "heartbeat_interval": None,
+    "resume_token": None
+}, ["user_id", "heartbeat_interval", "resume_token"])
+
+_WAITING = MessageTemplate({
+    "type": "waiting",
+    "message": "Looking for a conversation partner...",
+    "queue_position": None
+}, ["queue_position"])
+
+_MATCH_FOUND = MessageTemplate({
+    "type": "match_found",
+    "message": "Partner found! Ready to start conversation.",
+    "partner_country": None,
+    "partner_language": None,
+    "your_country": None
+}, ["partner_country", "partner_language", "your_country"])
+
+# Пачка chat_message одному получателю: готовые кадры вставляются без повторного кодирования
+_CHAT_BATCH_PREFIX = json.dumps({"type": "chat_batch", "messages": []})[:-2]
+
+_CHAT_MESSAGE = MessageTemplate({
+    "type": "chat_message",
+    "text": None,
+    "from_user": None
+}, ["text", "from_user"])
+
+# chat_message с метками для трассировки задержек (если клиент прислал seq)
+_TRACED_CHAT_MESSAGE = MessageTemplate({
+    "type": "chat_message",
+    "text": None,
+    "from_user": None,
+    "seq": None,
+    "client_ts": None,
+    "server_recv_ts": None,
+    "server_send_ts": None
+}, ["text", "from_user", "seq", "client_ts", "server_recv_ts", "server_send_ts"])
+
+_CHAT_ACK = MessageTemplate({
+    "type": "chat_ack",
+    "seq": None,
+    "server_recv_ts": None,
+    "server_send_ts": None,
+    "client_recv_ts": None
+}, ["seq", "server_recv_ts", "server_send_ts", "client_recv_ts"])
+
+_ERROR = MessageTemplate({
+    "type": "error",
+    "message": None
+}, ["message"])
+
+_SERVER_DRAINING = MessageTemplate({
+    "type": "server_draining",
+    "message": "Server is restarting, please reconnect",
+    "reconnect_after": None
+}, ["reconnect_after"])
+
+
+def connection_established(user_id: str, heartbeat_interval: float, resume_token: str) -> str:
+    return _CONNECTION_ESTABLISHED.render(user_id=user_id, heartbeat_interval=heartbeat_interval,
+                                          resume_token=resume_token)
+
+
+def waiting(queue_position: int) -> str:
+    return _WAITING.render(queue_position=queue_position)
+
+
+def match_found(partner_country: str, partner_language: str, your_country: str) -> str:
+    return _MATCH_FOUND.render(
+        partner_country=partner_country,
+        partner_language=partner_language,
+        your_country=your_country
+    )
+
+
+def chat_message(text: str, from_user: str) -> str:
+    return _CHAT_MESSAGE.render(text=text, from_user=from_user)
+
+
+def traced_chat_message(text: str, from_user: str, seq: int, client_ts: float,
+                        server_recv_ts: float, server_send_ts: float) -> str:
+    return _TRACED_CHAT_MESSAGE.render(
+        text=text,
+        from_user=from_user,
+        seq=seq,
+        client_ts=client_ts,
+        server_recv_ts=server_recv_ts,
+        server_send_ts=server_send_ts
+    )
+
+
+def chat_batch(frames: Sequence[str]) -> str:
+    """Склеиваем уже закодированные кадры chat_message в один кадр chat_batch"""
+    return _CHAT_BATCH_PREFIX + ", ".join(frames) + "]}"
+
+
+def chat_ack(seq: int, server_recv_ts: float, server_send_ts: float, client_recv_ts: float) -> str:
+    return _CHAT_ACK.render(
+        seq=seq,
+        server_recv_ts=server_recv_ts,
+        server_send_ts=server_send_ts,
+        client_recv_ts=client_recv_ts
+    )
+
+
+def error(message: str) -> str:
+    return _ERROR.render(message=message)
+
+
+def server_draining(reconnect_after: float) -> str:
+    return _SERVER_DRAINING.render(reconnect_after=reconnect_after)
@@ -0,0 +1,127 @@
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import uvicorn
+
+from .config import WORKER_ENV, ServerConfig
+
+ShutdownHook = Callable[[], Awaitable[None]]
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def uvicorn_options(config: ServerConfig) -> Dict[str, Any]:
+    """Параметры uvicorn: uvloop и httptools, если установлены, и лимиты WebSocket"""
+    return {
+        "loop": "uvloop" if _available("uvloop") else "asyncio",
+        "http": "httptools" if _available("httptools") else "h11",
+        "ws": "websockets" if _available("websockets") else "auto",
+        "ws_max_size": config.ws_max_size,
+        "ws_max_queue": config.ws_max_queue,
+        "ws_ping_interval": config.ws_ping_interval,
+        "ws_ping_timeout": config.ws_ping_timeout,
+        "backlog": config.backlog,
+        "log_level": "debug" if config.debug else "info",
+    }
+
+
+def create_reuseport_socket(host: str, port: int, backlog: int) -> socket.socket:
+    """Слушающий сокет с SO_REUSEPORT: ядро само распределяет соединения между процессами"""
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("SO_REUSEPORT is not supported on this platform, set WORKERS=1")
+
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn.Server, который перед остановкой сначала выполняет before_shutdown.
+
+    Штатный Server.shutdown закрывает все WebSocket кодом 1012 еще до lifespan
+    shutdown, поэтому дренаж из lifespan при SIGTERM не успевает сработать.
+    Здесь хук выполняется, пока соединения еще открыты. Повторный Ctrl+C
+    (force_exit) прерывает ожидание хука.
+    """
+
+    def __init__(self, config: uvicorn.Config, before_shutdown: Optional[ShutdownHook] = None):
+        super().__init__(config)
+        self.before_shutdown = before_shutdown
+
+    async def shutdown(self, sockets: Optional[List[socket.socket]] = None) -> None:
+        if self.before_shutdown is not None and not self.force_exit:
+            task = asyncio.ensure_future(self.before_shutdown())
+            while not task.done() and not self.force_exit:
+                await asyncio.wait({task}, timeout=0.1)
+            if task.done():
+                if not task.cancelled() and task.exception() is not None:
+                    logging.error(f"Shutdown hook failed: {task.exception()!r}")
+            else:
+                task.cancel()
+        await super().shutdown(sockets)
+
+
+def _serve_worker(app, config: ServerConfig, before_shutdown: Optional[ShutdownHook], index: int):
+    # Своя группа процессов: Ctrl+C получает только родитель и один раз пересылает воркерам
+    os.setpgrp()
+    # По номеру воркера lifespan выбирает свои файлы снимка и записи трафика
+    os.environ[WORKER_ENV] = str(index)
+
+    sock = create_reuseport_socket(config.host, config.port, config.backlog)
+    server = DrainingServer(uvicorn.Config(app, **uvicorn_options(config)), before_shutdown)
+    server.run(sockets=[sock])
+
+
+def serve(app, config: ServerConfig, before_shutdown: Optional[ShutdownHook] = None):
+    """Запускаем сервер: один процесс или несколько через SO_REUSEPORT.
+
+    Состояние ConnectionManager у каждого процесса свое, поэтому при WORKERS > 1
+    пары подбираются только среди пользователей одного процесса, а снимок
+    состояния и запись трафика каждый воркер пишет в свой файл.
+    before_shutdown выполняется в каждом процессе при SIGTERM/SIGINT до того,
+    как uvicorn закроет открытые соединения.
+    """
+    options = uvicorn_options(config)
+    logging.info(
+        f"Starting {config.workers} worker(s) on {config.host}:{config.port} "
+        f"(loop={options['loop']}, http={options['http']})"
+    )
+
+    if config.workers == 1:
+        server_config = uvicorn.Config(app, host=config.host, port=config.port, **options)
+        DrainingServer(server_config, before_shutdown).run()
+        return
+
+    # fork: дочерние процессы наследуют уже импортированное приложение
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_serve_worker, args=(app, config, before_shutdown, i), name=f"bridge-worker-{i}")
+        for i in range(config.workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # SIGTERM/SIGINT пересылаем воркерам как SIGTERM: DrainingServer каждого воркера
+    # выполняет before_shutdown до закрытия соединений
+    def stop_workers(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+    for process in processes:
+        process.join()
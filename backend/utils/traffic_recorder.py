@@ -0,0 +1,138 @@
+import gzip
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Виды записей в логе
+CONNECT = "c"  # Первый кадр клиента (данные пользователя)
+INBOUND = "i"  # Кадр от клиента
+OUTBOUND = "o"  # Кадр от сервера
+CLOSE = "x"  # Отключение
+
+_STOP = object()
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class TrafficRecorder:
+    """Opt-in запись трафика /ws в компактный лог с метками времени.
+
+    Каждая строка - JSON-массив [секунды от старта, номер соединения, вид, кадр].
+    Запись идет в отдельном потоке, event loop только кладет кадры в очередь.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._started = time.monotonic()
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._connection_numbers = itertools.count(1)
+        self._thread = threading.Thread(target=self._write_loop, name="traffic-recorder", daemon=True)
+        self._thread.start()
+        logging.info(f"Recording /ws traffic to {path}")
+
+    def new_connection(self) -> int:
+        """Короткий номер соединения вместо длинного user_id"""
+        return next(self._connection_numbers)
+
+    def record(self, connection: int, kind: str, frame: Optional[str] = None):
+        self._queue.put((round(time.monotonic() - self._started, 6), connection, kind, frame))
+
+    def wrap(self, websocket) -> "RecordingWebSocket":
+        return RecordingWebSocket(websocket, self)
+
+    def close(self):
+        """Дописываем остаток очереди и останавливаем поток записи"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _write_loop(self):
+        with _open(self.path, "at") as f:
+            while True:
+                batch: List[str] = []
+                stop = False
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                    while True:
+                        if item is _STOP:
+                            stop = True
+                            break
+                        batch.append(json.dumps(item, ensure_ascii=False, separators=(",", ":")))
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+                if batch:
+                    f.write("\n".join(batch) + "\n")
+                    f.flush()
+                if stop:
+                    return
+
+
+class RecordingWebSocket:
+    """Обертка над WebSocket, которая пишет все кадры соединения в TrafficRecorder"""
+
+    def __init__(self, websocket, recorder: TrafficRecorder):
+        self._websocket = websocket
+        self._recorder = recorder
+        self._connection = recorder.new_connection()
+        self._handshake_received = False
+        self._closed = False
+
+    async def receive_text(self) -> str:
+        try:
+            data = await self._websocket.receive_text()
+        except Exception:
+            self._record_close()
+            raise
+        self._recorder.record(self._connection, INBOUND if self._handshake_received else CONNECT, data)
+        self._handshake_received = True
+        return data
+
+    async def send_text(self, data: str):
+        # После закрытия кадр клиенту уже не доставить - в лог его не пишем
+        if not self._closed:
+            self._recorder.record(self._connection, OUTBOUND, data)
+        await self._websocket.send_text(data)
+
+    async def close(self, code: int = 1000):
+        self._record_close()
+        await self._websocket.close(code=code)
+
+    def _record_close(self):
+        if not self._closed:
+            self._closed = True
+            self._recorder.record(self._connection, CLOSE)
+
+    def __getattr__(self, name):
+        return getattr(self._websocket, name)
+
+
+def load_capture(path: str) -> Dict[int, List[Tuple[float, str, Optional[str]]]]:
+    """Читаем лог и группируем события по соединениям"""
+    connections: Dict[int, List[Tuple[float, str, Optional[str]]]] = {}
+    for timestamp, connection, kind, frame in iter_capture(path):
+        connections.setdefault(connection, []).append((timestamp, kind, frame))
+    for events in connections.values():
+        events.sort(key=lambda event: event[0])
+    return connections
+
+
+def iter_capture(path: str) -> Iterator[Tuple[float, int, str, Optional[str]]]:
+    with _open(path, "rt") as f:
+        try:
+            for line in f:
+                if line.strip():
+                    timestamp, connection, kind, frame = json.loads(line)
+                    yield timestamp, connection, kind, frame
+        except EOFError:
+            # Сервер остановлен аварийно - gzip не дописан, читаем что успели сбросить
+            logging.warning(f"Capture {path} is truncated")
@@ -1,7 +1,8 @@
 import asyncio
-import websockets
 import json
-from threading import Thread
+import time
+from collections import OrderedDict, deque
+from threading import Thread, Lock
 from kivy.clock import Clock
 from kivy.logger import Logger
 import sys
@@ -10,6 +11,17 @@ import os
 # Добавляем путь для импортов если нужно
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+SERVER_URL = os.environ.get("BRIDGE_SERVER_URL", "ws://localhost:8000/ws")
+# Метки seq/времени в chat_message для замера задержек (BRIDGE_TRACE_LATENCY=0 отключает)
+TRACE_LATENCY = os.environ.get("BRIDGE_TRACE_LATENCY", "1") != "0"
+# Просим сервер склеивать быстрые сообщения в chat_batch (BRIDGE_CHAT_BATCHING=0 отключает)
+CHAT_BATCHING = os.environ.get("BRIDGE_CHAT_BATCHING", "1") != "0"
+# Сколько неподтвержденных сообщений и замеров RTT храним
+MAX_PENDING_ACKS = 256
+RTT_WINDOW = 500
+# Сколько живет заранее открытое соединение, если пользователь так и не нажал "Find Partner"
+PREWARM_TTL = 30
+
 
 class BridgeClient:
     def __init__(self):
@@ -18,14 +30,78 @@ class BridgeClient:
         self.user_id = None
         self.on_message_callback = None
         self.on_status_callback = None
+        self.heartbeat_interval = 15  # Сервер присылает свое значение в connection_established
+        self.session_token = None  # Секрет текущей сессии из connection_established
+        self.resume_token = None  # Отправляется при переподключении после перезапуска сервера
+        self.reconnect_after = None
+        self._heartbeat_task = None
+        # Сообщения копятся здесь и уходят в UI одной пачкой за кадр
+        self._pending_messages = []
+        self._pending_lock = Lock()
+        self._flush_trigger = Clock.create_trigger(self._flush_messages)
+        # Трассировка задержек: seq -> время отправки, и последние замеры RTT
+        self.trace_latency = TRACE_LATENCY
+        self._next_seq = 0
+        self._pending_acks = OrderedDict()
+        self._rtt_samples = deque(maxlen=RTT_WINDOW)
+        # Заранее открытое соединение (DNS, TCP/TLS и WebSocket handshake уже пройдены)
+        self._prewarmed = None
+        self._prewarm_expiry = None
 
     def set_callbacks(self, message_callback, status_callback):
-        """Устанавливаем callback-функции для обновления UI"""
+        """Устанавливаем callback-функции для обновления UI
+
+        message_callback получает список сообщений, накопленных за кадр.
+        """
         self.on_message_callback = message_callback
         self.on_status_callback = status_callback
 
+    async def prewarm(self):
+        """Открываем соединение заранее, пока пользователь выбирает страну"""
+        if self.connected or self._prewarmed is not None:
+            return
+        import websockets
+
+        try:
+            websocket = await websockets.connect(SERVER_URL, ping_interval=20, ping_timeout=10)
+            if self.connected:
+                # Пользователь успел подключиться сам - заготовка не нужна
+                await websocket.close()
+                return
+            self._prewarmed = websocket
+            self._prewarm_expiry = asyncio.get_running_loop().call_later(
+                PREWARM_TTL, lambda: asyncio.ensure_future(self._drop_prewarmed())
+            )
+            Logger.info("BridgeClient: Connection prewarmed")
+        except Exception as e:
+            # Не страшно - соединение откроется при нажатии "Find Partner"
+            Logger.warning(f"BridgeClient: Prewarm failed: {e}")
+
+    async def _drop_prewarmed(self):
+        """Закрываем неиспользованное заранее открытое соединение"""
+        websocket, self._prewarmed = self._prewarmed, None
+        if self._prewarm_expiry is not None:
+            self._prewarm_expiry.cancel()
+            self._prewarm_expiry = None
+        if websocket is not None:
+            await websocket.close()
+
+    async def _open_websocket(self):
+        """Берем заранее открытое соединение, если оно живо, иначе открываем новое"""
+        websocket, self._prewarmed = self._prewarmed, None
+        if self._prewarm_expiry is not None:
+            self._prewarm_expiry.cancel()
+            self._prewarm_expiry = None
+        if websocket is not None and websocket.open:
+            return websocket
+
+        import websockets
+        return await websockets.connect(SERVER_URL, ping_interval=20, ping_timeout=10)
+
     async def _listen_messages(self):
         """Прослушиваем сообщения от сервера"""
+        import websockets
+
         try:
             async for message in self.websocket:
                 await self._handle_message(message)
@@ -47,6 +123,8 @@ class BridgeClient:
 
             if data["type"] == "connection_established":
                 self.user_id = data.get("user_id")
+                self.session_token = data.get("resume_token")
+                self.heartbeat_interval = data.get("heartbeat_interval", self.heartbeat_interval)
                 self._update_status("Connected to server")
                 Logger.info(f"BridgeClient: Connection established, user_id: {self.user_id}")
 
@@ -63,18 +141,31 @@ class BridgeClient:
                 self._update_status(f"Looking for partner... Queue position: {queue_pos}")
 
             elif data["type"] == "chat_message":
-                text = data.get("text", "")
-                from_user = data.get("from_user", "")
-                Logger.info(f"BridgeClient: Received chat message from {from_user}: {text}")
-                display_text = f"Partner: {text}" if from_user != self.user_id else f"You: {text}"
-                self._show_message(display_text)
-                Logger.info(f"BridgeClient: Displaying chat message: {display_text}")
+                await self._handle_chat_message(data)
+
+            elif data["type"] == "chat_batch":
+                # Несколько сообщений одним кадром - в UI они попадут одним обновлением
+                for chat_message in data.get("messages", []):
+                    await self._handle_chat_message(chat_message)
+
+            elif data["type"] == "chat_ack":
+                sent_at = self._pending_acks.pop(data.get("seq"), None)
+                if sent_at is not None:
+                    self._rtt_samples.append(time.monotonic() - sent_at)
 
             elif data["type"] == "partner_disconnected":
                 Logger.info("BridgeClient: Partner disconnected")
                 self._show_message("System: Your partner has disconnected")
                 self._update_status("Partner disconnected")
 
+            elif data["type"] == "server_draining":
+                # Сервер перезапускается - переподключимся после паузы
+                self.resume_token = self.session_token
+                self.reconnect_after = data.get("reconnect_after", 0)
+                Logger.info(f"BridgeClient: Server draining, reconnect in {self.reconnect_after}s")
+                self._show_message("System: Server is restarting, reconnecting...")
+                self._update_status("Reconnecting...")
+
             elif data["type"] == "error":
                 error_msg = data.get("message", "Unknown error")
                 Logger.error(f"BridgeClient: Server error: {error_msg}")
@@ -85,6 +176,15 @@ class BridgeClient:
         except Exception as e:
             Logger.error(f"BridgeClient: Message handling error: {e}")
 
+    async def _handle_chat_message(self, data):
+        text = data.get("text", "")
+        from_user = data.get("from_user", "")
+        display_text = f"Partner: {text}" if from_user != self.user_id else f"You: {text}"
+        self._show_message(display_text)
+        Logger.info(f"BridgeClient: Displaying chat message: {display_text}")
+        if "seq" in data:
+            await self._send_ack(data)
+
     async def send_message(self, text):
         """Отправляем текстовое сообщение"""
         if self.connected and self.websocket:
@@ -94,6 +194,13 @@ class BridgeClient:
                     "text": text,
                     "user_id": self.user_id
                 }
+                if self.trace_latency:
+                    self._next_seq += 1
+                    message_data["seq"] = self._next_seq
+                    message_data["client_ts"] = time.time()
+                    self._pending_acks[self._next_seq] = time.monotonic()
+                    if len(self._pending_acks) > MAX_PENDING_ACKS:
+                        self._pending_acks.popitem(last=False)  # ack потерялся - забываем
                 Logger.info(f"BridgeClient: Sending message: {text}")
                 await self.websocket.send(json.dumps(message_data))
                 # НЕ добавляем сообщение здесь - ждем подтверждения от сервера
@@ -101,8 +208,40 @@ class BridgeClient:
                 Logger.error(f"BridgeClient: Send message error: {e}")
                 self._show_message(f"Error sending message: {e}")
 
+    async def _send_ack(self, data):
+        """Подтверждаем получение сообщения, чтобы сервер и отправитель посчитали задержки"""
+        try:
+            await self.websocket.send(json.dumps({
+                "type": "chat_ack",
+                "seq": data.get("seq"),
+                "server_recv_ts": data.get("server_recv_ts"),
+                "server_send_ts": data.get("server_send_ts"),
+                "client_recv_ts": time.time()
+            }))
+        except Exception as e:
+            Logger.warning(f"BridgeClient: Ack send error: {e}")
+
+    def rtt_stats(self):
+        """Статистика RTT своих сообщений (отправка -> ack получателя), миллисекунды"""
+        samples = sorted(self._rtt_samples)
+        if not samples:
+            return {"count": 0, "unacked": len(self._pending_acks)}
+        last = len(samples) - 1
+        return {
+            "count": len(samples),
+            "unacked": len(self._pending_acks),
+            "min_ms": samples[0] * 1000,
+            "mean_ms": sum(samples) / len(samples) * 1000,
+            "p50_ms": samples[last // 2] * 1000,
+            "p95_ms": samples[int(last * 0.95)] * 1000,
+            "max_ms": samples[-1] * 1000,
+        }
+
     async def disconnect(self):
         """Отключаемся от сервера"""
+        self.reconnect_after = None  # Пользователь сам отключился - не переподключаемся
+        self._stop_heartbeat()
+        await self._drop_prewarmed()
         if self.websocket:
             await self.websocket.close()
         self.connected = False
@@ -114,61 +253,102 @@ class BridgeClient:
             Clock.schedule_once(lambda dt: self.on_status_callback(status))
 
     def _show_message(self, message):
-        """Показываем сообщение через callback"""
+        """Показываем сообщение через callback (не чаще одного обновления UI за кадр)"""
         if self.on_message_callback:
-            Clock.schedule_once(lambda dt: self.on_message_callback(message))
+            with self._pending_lock:
+                self._pending_messages.append(message)
+            self._flush_trigger()
+
+    def _flush_messages(self, dt):
+        """Передаем в UI все сообщения, накопившиеся с прошлого кадра"""
+        with self._pending_lock:
+            messages, self._pending_messages = self._pending_messages, []
+        if messages and self.on_message_callback:
+            self.on_message_callback(messages)
 
-    async def _heartbeat(self):
-        """Отправляем heartbeat сообщения"""
-        while self.connected and self.websocket:
+    async def _heartbeat(self, websocket):
+        """Отправляем heartbeat сообщения, пока живо соединение, для которого запущены"""
+        while self.connected and self.websocket is websocket:
             try:
-                await asyncio.sleep(15)  # Каждые 15 секунд (меньше чем таймаут 30s)
-                if self.connected and self.websocket:
+                await asyncio.sleep(self.heartbeat_interval)  # Меньше чем таймаут неактивности на сервере
+                if self.connected and self.websocket is websocket:
                     heartbeat_msg = json.dumps({"type": "heartbeat"})
-                    await self.websocket.send(heartbeat_msg)
+                    await websocket.send(heartbeat_msg)
                     Logger.debug("BridgeClient: Heartbeat sent")
             except Exception as e:
                 Logger.error(f"BridgeClient: Heartbeat error: {e}")
                 break
 
+    def _stop_heartbeat(self):
+        task, self._heartbeat_task = self._heartbeat_task, None
+        if task is not None:
+            task.cancel()
+
     async def connect(self, country="Russia", language="en"):
         """Подключаемся к WebSocket серверу"""
         try:
             self._update_status("Connecting to server...")
 
-            self.websocket = await websockets.connect("ws://localhost:8000/ws", ping_interval=20, ping_timeout=10)
-            self.connected = True
-            self.in_chat_mode = False  # Сбрасываем флаг чата
+            while True:
+                self.websocket = await self._open_websocket()
+                self.connected = True
+                self.in_chat_mode = False  # Сбрасываем флаг чата
+                self.reconnect_after = None
 
-            # Отправляем данные пользователя
-            user_data = {
-                "country": country,
-                "language": language
-            }
-            await self.websocket.send(json.dumps(user_data))
-            self._update_status("Waiting for partner...")
+                # Отправляем данные пользователя
+                user_data = {
+                    "country": country,
+                    "language": language
+                }
+                if CHAT_BATCHING:
+                    user_data["batching"] = True
+                if self.resume_token:
+                    user_data["resume_token"] = self.resume_token
+                    self.resume_token = None
+                await self.websocket.send(json.dumps(user_data))
+                self._update_status("Waiting for partner...")
+
+                # Запускаем heartbeat в фоне; цикл прошлого соединения (после перезапуска сервера) гасим
+                self._stop_heartbeat()
+                self._heartbeat_task = asyncio.create_task(self._heartbeat(self.websocket))
 
-            # Запускаем heartbeat в фоне
-            asyncio.create_task(self._heartbeat())
+                # Запускаем прослушивание сообщений
+                await self._listen_messages()
 
-            # Запускаем прослушивание сообщений
-            await self._listen_messages()
+                # Сервер попросил переподключиться - ждем указанную паузу
+                if self.reconnect_after is None:
+                    break
+                await asyncio.sleep(self.reconnect_after)
 
         except Exception as e:
             self._update_status(f"Connection error: {str(e)}")
             self.connected = False
 
 
-# Глобальный экземпляр клиента
-client = BridgeClient()
+# Глобальный экземпляр клиента и фоновый event loop создаются при первом обращении
+_client = None
+_loop = None
+_loop_lock = Lock()
 
 
-def run_async_task(coro):
-    """Запускаем асинхронную задачу в отдельном потоке"""
+def get_client():
+    """Возвращаем общий экземпляр клиента"""
+    global _client
+    if _client is None:
+        _client = BridgeClient()
+    return _client
 
-    def run():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(coro)
 
-    Thread(target=run, daemon=True).start()
\ No newline at end of file
+def _get_loop():
+    """Один event loop на все время работы приложения - соединение живет в нем"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            Thread(target=_loop.run_forever, name="bridge-client-loop", daemon=True).start()
+    return _loop
+
+
+def run_async_task(coro):
+    """Запускаем асинхронную задачу в фоновом event loop клиента"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop())
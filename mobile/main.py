@@ -1,28 +1,68 @@
-from kivy.app import App
-from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.button import Button
-from kivy.uix.label import Label
-from kivy.uix.textinput import TextInput
-from kivy.uix.scrollview import ScrollView
-from kivy.uix.spinner import Spinner
-from kivy.core.window import Window
-import asyncio
+import time
 import sys
 import os
 
+# Момент старта процесса для замера времени до первого кадра (см. startup_benchmark.py)
+_PROCESS_T0 = float(os.environ.get("BRIDGE_STARTUP_T0") or time.time())
+
+from kivy.app import App
+from kivy.clock import Clock
+from collections import deque
+
 # Добавляем путь для импортов
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Сколько сообщений храним и показываем в истории чата
+MAX_HISTORY = 200
+
+# Строка чата переиспользуется RecycleView - создаются только видимые виджеты
+CHAT_VIEW_KV = """
+<ChatMessageLabel@Label>:
+    size_hint_y: None
+    text_size: self.width, None
+    height: self.texture_size[1] + dp(4)
+    halign: 'left'
+    valign: 'top'
+
+<ChatView@RecycleView>:
+    viewclass: 'ChatMessageLabel'
+    RecycleBoxLayout:
+        default_size: None, dp(24)
+        default_size_hint: 1, None
+        size_hint_y: None
+        height: self.minimum_height
+        orientation: 'vertical'
+"""
+
 
-from async_client import client, run_async_task
+def run_async_task(coro):
+    """Запускаем корутину в фоновом event loop клиента (модуль грузится лениво)"""
+    from async_client import run_async_task as run
+    return run(coro)
 
 
 class BridgeApp(App):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.messages = []
+        # Кольцевой буфер: старые сообщения вытесняются автоматически
+        self.messages = deque(maxlen=MAX_HISTORY)
+        self.client = None
 
     def build(self):
+        # Виджеты и клиент импортируем здесь, а не при импорте модуля - быстрее холодный старт
+        from kivy.uix.boxlayout import BoxLayout
+        from kivy.uix.button import Button
+        from kivy.uix.label import Label
+        from kivy.uix.textinput import TextInput
+        from kivy.uix.spinner import Spinner
+        from kivy.core.window import Window
+        from kivy.lang import Builder
+        from kivy.factory import Factory
+        from async_client import get_client
+
+        Builder.load_string(CHAT_VIEW_KV)
+        self.client = get_client()
+
         Window.size = (400, 600)
         self.title = "Bridge - Connect the World"
 
@@ -38,17 +78,12 @@ class BridgeApp(App):
         main_layout.add_widget(self.status_label)
 
         # Область сообщений
-        scroll_view = ScrollView(size_hint_y=0.6)
-        self.chat_label = Label(
-            text="Welcome to Bridge!\nPress 'Connect' to find a conversation partner.\n\n",
-            size_hint_y=None,
-            text_size=(380, None),
-            halign='left',
-            valign='top'
-        )
-        self.chat_label.bind(texture_size=self.chat_label.setter('size'))
-        scroll_view.add_widget(self.chat_label)
-        main_layout.add_widget(scroll_view)
+        self.chat_view = Factory.ChatView(size_hint_y=0.6)
+        main_layout.add_widget(self.chat_view)
+        self.add_messages([
+            "Welcome to Bridge!",
+            "Press 'Connect' to find a conversation partner."
+        ])
 
         # Панель управления
         control_layout = BoxLayout(orientation='horizontal', size_hint_y=0.15, spacing=10)
@@ -81,7 +116,7 @@ class BridgeApp(App):
         main_layout.add_widget(input_layout)
 
         # Настраиваем callback-функции для клиента
-        client.set_callbacks(self.add_message, self.update_status)
+        self.client.set_callbacks(self.add_messages, self.update_status)
 
         # Добавляем выбор страны перед кнопкой подключения
         country_layout = BoxLayout(orientation='horizontal', size_hint_y=0.1, spacing=10)
@@ -97,6 +132,20 @@ class BridgeApp(App):
 
         return main_layout
 
+    def on_start(self):
+        # Пока пользователь выбирает страну, заранее открываем соединение с сервером
+        run_async_task(self.client.prewarm())
+
+        if os.environ.get("BRIDGE_STARTUP_BENCHMARK"):
+            from kivy.core.window import Window
+            Window.bind(on_flip=self._report_first_frame)
+
+    def _report_first_frame(self, window):
+        """Печатаем время до первого кадра и закрываемся (режим бенчмарка)"""
+        window.unbind(on_flip=self._report_first_frame)
+        print(f"BRIDGE_FIRST_FRAME {time.time() - _PROCESS_T0:.4f}", flush=True)
+        Clock.schedule_once(lambda dt: self.stop())
+
     def connect_to_server(self, instance):
         """Подключаемся к серверу"""
         self.update_status("Connecting...")
@@ -108,14 +157,14 @@ class BridgeApp(App):
         print(f"Connecting as: {country}")  # Для дебага
 
         # Запускаем подключение в отдельном потоке
-        run_async_task(client.connect(country, language))
+        run_async_task(self.client.connect(country, language))
 
         # Включаем кнопку отключения
         self.disconnect_btn.disabled = False
 
     def disconnect_from_server(self, instance):
         """Отключаемся от сервера"""
-        run_async_task(client.disconnect())
+        run_async_task(self.client.disconnect())
         self.connect_btn.disabled = False
         self.disconnect_btn.disabled = True
         self.message_input.disabled = True
@@ -124,11 +173,11 @@ class BridgeApp(App):
     def send_message(self, instance):
         """Отправляем сообщение"""
         text = self.message_input.text.strip()
-        if text and client.connected:
+        if text and self.client.connected:
             # НЕ добавляем сообщение сразу в интерфейс
             # Ждем пока сервер перешлет его партнеру и вернет обработа
             print(f"Attempting to send message: {text}")  # Дебаг
-            run_async_task(client.send_message(text))
+            run_async_task(self.client.send_message(text))
             self.message_input.text = ""
 
     def update_status(self, status):
@@ -148,20 +197,22 @@ class BridgeApp(App):
 
     def add_message(self, message):
         """Добавляем сообщение в чат"""
-        current_text = self.chat_label.text
-        if len(current_text.split('\n')) > 20:  # Ограничиваем историю
-            current_text = '\n'.join(current_text.split('\n')[-15:])
+        self.add_messages([message])
+
+    def add_messages(self, messages):
+        """Добавляем пачку сообщений в чат одним обновлением интерфейса"""
+        self.messages.extend(messages)
+        self.chat_view.data = [{"text": message} for message in self.messages]
 
-        self.chat_label.text = current_text + f"\n{message}"
+        # Прокручиваем вниз после того, как RecycleView пересчитает layout
+        Clock.schedule_once(self._scroll_to_bottom)
 
-        # Прокручиваем вниз
-        scroll_parent = self.chat_label.parent
-        if scroll_parent:
-            scroll_parent.scroll_y = 0
+    def _scroll_to_bottom(self, dt):
+        self.chat_view.scroll_y = 0
 
     def on_stop(self):
         """При закрытии приложения отключаемся от сервера"""
-        run_async_task(client.disconnect())
+        run_async_task(self.client.disconnect())
 
 
 if __name__ == "__main__":
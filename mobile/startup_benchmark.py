@@ -0,0 +1,96 @@
+"""Бенчмарк холодного старта мобильного клиента.
+
+Меряет в свежих процессах время импорта main.py и время от запуска процесса
+до первого отрисованного кадра. Запускать на устройстве или в эмуляторе:
+
+    python startup_benchmark.py --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MOBILE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_import(runs: int):
+    """Время импорта модуля main (без создания окна), секунды"""
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=MOBILE_DIR, capture_output=True, text=True, check=True,
+            env={**os.environ, "KIVY_NO_ARGS": "1", "KIVY_NO_CONSOLELOG": "1"}
+        ).stdout
+        results.append(float(output.strip().splitlines()[-1]))
+    return results
+
+
+def measure_first_frame(runs: int, timeout: float):
+    """Время от запуска процесса до первого кадра, секунды"""
+    results = []
+    for _ in range(runs):
+        env = {
+            **os.environ,
+            "KIVY_NO_ARGS": "1",
+            "BRIDGE_STARTUP_BENCHMARK": "1",
+            "BRIDGE_STARTUP_T0": repr(time.time()),
+        }
+        process = subprocess.run(
+            [sys.executable, "main.py"], cwd=MOBILE_DIR, capture_output=True, text=True,
+            env=env, timeout=timeout
+        )
+        for line in process.stdout.splitlines():
+            if line.startswith("BRIDGE_FIRST_FRAME"):
+                results.append(float(line.split()[1]))
+                break
+        else:
+            print(f"First frame marker not found:\n{process.stdout[-2000:]}{process.stderr[-2000:]}")
+    return results
+
+
+def show_top_imports(limit: int):
+    """Самые тяжелые модули при импорте main (по -X importtime)"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=MOBILE_DIR,
+        capture_output=True, text=True, env={**os.environ, "KIVY_NO_ARGS": "1", "KIVY_NO_CONSOLELOG": "1"}
+    )
+    rows = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # Формат строки: "import time: <self us> | <cumulative us> | <module>"
+        _, cumulative_us, name = line.split("|", 2)
+        rows.append((int(cumulative_us), name.strip()))
+    for cumulative_us, name in sorted(rows, reverse=True)[:limit]:
+        print(f"  {cumulative_us / 1000:8.1f}ms  {name}")
+
+
+def _summary(name, values):
+    if not values:
+        print(f"{name}: no data")
+        return
+    print(f"{name}: median={statistics.median(values) * 1000:.1f}ms "
+          f"min={min(values) * 1000:.1f}ms max={max(values) * 1000:.1f}ms (n={len(values)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bridge mobile startup benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--top", type=int, default=10, help="Show the N slowest imports")
+    parser.add_argument("--skip-window", action="store_true", help="Only measure import time")
+    args = parser.parse_args()
+
+    _summary("import main", measure_import(args.runs))
+    if not args.skip_window:
+        _summary("time to first frame", measure_first_frame(args.runs, args.timeout))
+    if args.top:
+        print("Slowest imports (cumulative):")
+        show_top_imports(args.top)
+
+
+if __name__ == "__main__":
+    main()
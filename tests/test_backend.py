@@ -3,11 +3,13 @@ import json
 import sys
 import os
 import asyncio
+import time
 
 # Добавляем путь к backend
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from backend.utils.connection_manager import ConnectionManager
+from backend.utils import messages
 
 class MockWebSocket:
     """Mock объект для тестирования WebSocket"""
@@ -103,4 +105,825 @@ def test_disconnect(manager):
         assert manager.get_waiting_queue_size() == 0
     
     # Запускаем асинхронный код в синхронном тесте
-    asyncio.run(run_test())
\ No newline at end of file
+    asyncio.run(run_test())
+
+@pytest.mark.asyncio
+async def test_drain_mode_stops_matching(manager):
+    """Тестируем, что в режиме дренажа пары не подбираются"""
+    user1 = {"user_id": "user1", "country": "Russia", "language": "ru"}
+    user2 = {"user_id": "user2", "country": "USA", "language": "en"}
+
+    await manager.connect(MockWebSocket(), "user1", user1)
+    await manager.connect(MockWebSocket(), "user2", user2)
+    await manager.find_partner(user1)
+
+    manager.start_drain()
+    partner = await manager.find_partner(user2)
+    assert partner is None
+    assert manager.get_waiting_queue_size() == 1
+
+
+@pytest.mark.asyncio
+async def test_drain_closes_pairs_together(manager, tmp_path):
+    """Тестируем закрытие соединений пачками и сохранение снимка состояния"""
+    events = []
+
+    class ClosingWebSocket:
+        def __init__(self, user_id):
+            self.user_id = user_id
+
+        async def send_text(self, message):
+            events.append((self.user_id, json.loads(message)))
+
+        async def close(self, code=1000):
+            events.append((self.user_id, code))
+
+    manager.snapshot_path = str(tmp_path / "snapshot.json")
+    for user_id in ("a", "b", "c"):
+        user_data = {"user_id": user_id, "country": user_id, "resume_token": f"secret-{user_id}"}
+        await manager.connect(ClosingWebSocket(user_id), user_id, user_data)
+    # "a" и "c" в паре, "b" ждет
+    assert manager.pair_users("a", "c")
+
+    await manager.drain_connections(batch_size=2, batch_interval=0, reconnect_jitter=1.0)
+
+    closed = [user_id for user_id, event in events if event == 1012]
+    assert sorted(closed[:2]) == ["a", "c"] and closed[2:] == ["b"]
+    hints = [event for _, event in events if isinstance(event, dict)]
+    assert all(hint["type"] == "server_draining" for hint in hints)
+    assert all(0 <= hint["reconnect_after"] <= 1.0 for hint in hints)
+
+    # Новый процесс подхватывает сессии из снимка
+    new_manager = ConnectionManager(snapshot_path=manager.snapshot_path)
+    assert new_manager.load_snapshot() == 3
+    # user_id виден партнеру, поэтому сессия восстанавливается только по секретному токену
+    assert new_manager.restore_session("a") is None
+    saved = new_manager.restore_session("secret-a")
+    assert saved["user_id"] == "a"
+    assert saved["partner_id"] == "c"
+    assert new_manager.restore_session("secret-a") is None
+
+
+@pytest.mark.asyncio
+async def test_workers_write_separate_snapshots(tmp_path):
+    """Тестируем, что воркеры пишут свои снимки, а новый процесс читает их все"""
+    path = str(tmp_path / "state.json")
+    for worker, user_id in (("0", "a"), ("1", "b")):
+        manager = ConnectionManager(snapshot_path=path)
+        manager.worker = worker
+        user_data = {"user_id": user_id, "country": "Russia", "resume_token": f"secret-{user_id}"}
+        await manager.connect(MockWebSocket(), user_id, user_data)
+        manager.save_snapshot()
+
+    assert sorted(os.listdir(tmp_path)) == ["state.0.json", "state.1.json"]
+    new_manager = ConnectionManager(snapshot_path=path)
+    assert new_manager.load_snapshot() == 2
+    assert new_manager.restore_session("secret-b")["user_id"] == "b"
+
+    # Поздний снимок другого воркера подхватывается, выданная сессия не возвращается
+    late = ConnectionManager(snapshot_path=path)
+    late.worker = "1"
+    await late.connect(MockWebSocket(), "c", {"user_id": "c", "country": "USA", "resume_token": "secret-c"})
+    late.save_snapshot()
+    os.utime(late.snapshot_files()[-1], (time.time() + 1, time.time() + 1))
+    assert new_manager.restore_session("secret-c")["user_id"] == "c"
+    assert new_manager.restore_session("secret-b") is None
+    assert new_manager.restore_session("secret-a")["user_id"] == "a"
+
+
+@pytest.mark.asyncio
+async def test_resumed_user_rejoins_previous_partner():
+    """Тестируем восстановление прежней пары после перезапуска, даже если в очереди есть другие"""
+    now = [0.0]
+    manager = ConnectionManager(clock=lambda: now[0], resume_grace=10)
+    stranger = {"user_id": "stranger", "country": "Japan", "language": "ja"}
+    resumed = {"user_id": "a", "country": "Russia", "language": "ru", "previous_partner_id": "b"}
+    old_partner = {"user_id": "b", "country": "USA", "language": "en", "previous_partner_id": "a"}
+    newcomer = {"user_id": "new", "country": "Brazil", "language": "pt"}
+
+    await manager.connect(MockWebSocket(), "stranger", stranger)
+    await manager.find_partner(stranger)
+
+    # "a" вернулся первым: незнакомцу его не отдаем, пока ждем "b"
+    await manager.connect(MockWebSocket(), "a", resumed)
+    assert await manager.find_partner(resumed) is None
+    await manager.connect(MockWebSocket(), "new", newcomer)
+    assert (await manager.find_partner(newcomer))["user_id"] == "stranger"
+
+    await manager.connect(MockWebSocket(), "b", old_partner)
+    partner = await manager.find_partner(old_partner)
+    assert partner["user_id"] == "a"
+    assert manager.get_waiting_queue_size() == 0
+
+
+@pytest.mark.asyncio
+async def test_resumed_user_is_released_after_grace():
+    """Тестируем, что прежний партнер держит пользователя не дольше resume_grace"""
+    now = [0.0]
+    manager = ConnectionManager(clock=lambda: now[0], resume_grace=10)
+    resumed = {"user_id": "a", "country": "Russia", "language": "ru", "previous_partner_id": "b"}
+    await manager.connect(MockWebSocket(), "a", resumed)
+    await manager.find_partner(resumed)
+
+    first = {"user_id": "c", "country": "USA", "language": "en"}
+    await manager.connect(MockWebSocket(), "c", first)
+    assert await manager.find_partner(first) is None
+
+    now[0] = 11
+    second = {"user_id": "d", "country": "Japan", "language": "ja"}
+    await manager.connect(MockWebSocket(), "d", second)
+    assert (await manager.find_partner(second))["user_id"] == "a"
+
+
+
+def test_concurrent_joins_and_disconnects_keep_state_consistent():
+    """Стресс-тест: тысячи параллельных подключений и отключений из нескольких потоков"""
+    import random
+    import threading
+
+    manager = ConnectionManager(num_shards=8)
+    countries = ["Russia", "USA", "Japan", "Brazil"]
+    matches = []
+    left = set()
+    results_lock = threading.Lock()
+
+    async def worker(worker_id: int):
+        rng = random.Random(worker_id)
+        for i in range(500):
+            user_id = f"w{worker_id}-{i}"
+            user = {"user_id": user_id, "country": rng.choice(countries), "language": "en"}
+            await manager.connect(MockWebSocket(), user_id, user)
+            partner = await manager.find_partner(user)
+            if partner is not None:
+                with results_lock:
+                    matches.append((user_id, partner["user_id"]))
+            if rng.random() < 0.3:
+                manager.disconnect(user_id)
+                with results_lock:
+                    left.add(user_id)
+
+    errors = []
+
+    def run_worker(worker_id: int):
+        try:
+            asyncio.run(worker(worker_id))
+        except Exception as e:
+            errors.append(e)
+
+    # Частое переключение потоков, чтобы гонки проявлялись, если блокировок не хватает
+    previous_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=run_worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(previous_interval)
+    assert not errors
+
+    # Никто не попал в пару дважды
+    matched = [user_id for pair in matches for user_id in pair]
+    assert len(matched) == len(set(matched))
+
+    waiting = {user["user_id"] for user in manager.waiting_users}
+    assert len(waiting) == manager.get_waiting_queue_size()
+    assert not waiting & left
+    assert not waiting & set(matched)
+    for user_id, partner_id in matches:
+        for a, b in ((user_id, partner_id), (partner_id, user_id)):
+            if a not in left:
+                assert manager.get_partner_id(a) == b
+
+    # Никто не потерян: каждый оставшийся либо ждет, либо в паре
+    assert len(manager.active_connections) == 8 * 500 - len(left)
+    for user_id, session in manager.active_connections.items():
+        assert (user_id in waiting) != bool(session.partner_id)
+
+
+def test_message_templates_match_json_dumps():
+    """Тестируем, что шаблоны дают тот же JSON, что и json.dumps"""
+    text = 'Привет, "мир"!\n\\ 🌍'
+    assert messages.chat_message(text, "user1") == json.dumps({
+        "type": "chat_message", "text": text, "from_user": "user1"
+    })
+    assert json.loads(messages.match_found("Russia", "ru", "USA")) == {
+        "type": "match_found",
+        "message": "Partner found! Ready to start conversation.",
+        "partner_country": "Russia",
+        "partner_language": "ru",
+        "your_country": "USA"
+    }
+    assert json.loads(messages.waiting(3))["queue_position"] == 3
+    assert json.loads(messages.PARTNER_DISCONNECTED)["type"] == "partner_disconnected"
+
+
+@pytest.mark.asyncio
+async def test_broadcast_sends_same_frame(manager):
+    """Тестируем рассылку одного кадра нескольким пользователям"""
+    received = []
+
+    class RecordingWebSocket:
+        async def send_text(self, message):
+            received.append(message)
+
+    for user_id in ("a", "b", "c"):
+        await manager.connect(RecordingWebSocket(), user_id, {"user_id": user_id, "country": user_id})
+
+    await manager.broadcast(messages.PARTNER_DISCONNECTED, ["a", "c", "missing"])
+    assert len(received) == 2
+    assert all(frame is messages.PARTNER_DISCONNECTED for frame in received)
+
+
+def test_simulator_is_deterministic():
+    """Тестируем симулятор подбора пар на синтетическом потоке"""
+    from backend.tools.simulator import MatchmakingSimulator, generate_arrivals
+
+    def simulate():
+        arrivals = generate_arrivals({"Russia": 2.0, "USA": 1.0}, duration=600, seed=42)
+        return MatchmakingSimulator().run(arrivals=arrivals)
+
+    report = simulate()
+    assert report.arrivals > 0
+    assert report.matched + report.abandoned + report.still_waiting == report.arrivals
+    assert set(report.pair_matches) == {"Russia <-> USA"}
+    assert report.op_stats["find_partner"]["calls"] == report.arrivals
+
+    again = simulate()
+    assert (again.matched, again.abandoned, again.wait_percentiles) == \
+        (report.matched, report.abandoned, report.wait_percentiles)
+
+
+def test_simulator_replays_recorded_trace(tmp_path):
+    """Тестируем прогон записанной трассы"""
+    from backend.tools.simulator import MatchmakingSimulator, load_trace
+
+    trace = tmp_path / "trace.csv"
+    trace.write_text(
+        "time,event,user_id,country,language\n"
+        "0,arrive,a,Russia,ru\n"
+        "1,arrive,b,Russia,ru\n"
+        "5,arrive,c,USA,en\n"
+        "7,leave,b,,\n"
+    )
+    report = MatchmakingSimulator().run(trace=load_trace(str(trace)))
+    assert report.matched == 2
+    assert report.abandoned == 1
+    assert report.wait_percentiles["max"] == 5.0
+
+
+def test_simulator_counts_countries_by_canonical_name(tmp_path):
+    """Тестируем, что варианты написания страны дают одну строку статистики"""
+    from backend.tools.simulator import MatchmakingSimulator, load_trace
+
+    trace = tmp_path / "trace.csv"
+    trace.write_text(
+        "time,event,user_id,country,language\n"
+        "0,arrive,a,USA,en\n"
+        "1,arrive,b,usa,en\n"
+        "2,arrive,c,United States,en\n"
+        "3,arrive,d,russia,ru\n"
+    )
+    report = MatchmakingSimulator().run(trace=load_trace(str(trace)))
+    assert set(report.country_match_rate) == {"USA", "Russia"}
+    assert report.pair_matches == {"Russia <-> USA": 1}
+    assert report.country_match_rate["USA"] == pytest.approx(1 / 3)
+
+
+@pytest.mark.asyncio
+async def test_traffic_recorder_writes_capture(tmp_path):
+    """Тестируем запись кадров соединения в лог"""
+    from backend.utils.traffic_recorder import TrafficRecorder, load_capture
+
+    class ScriptedWebSocket:
+        def __init__(self, frames):
+            self.frames = list(frames)
+
+        async def receive_text(self):
+            return self.frames.pop(0)
+
+        async def send_text(self, message):
+            pass
+
+        async def close(self, code=1000):
+            pass
+
+    path = str(tmp_path / "capture.jsonl.gz")
+    recorder = TrafficRecorder(path, flush_interval=0.01)
+    websocket = recorder.wrap(ScriptedWebSocket(['{"country": "Russia"}', '{"type": "heartbeat"}']))
+
+    await websocket.receive_text()
+    await websocket.send_text(messages.waiting(1))
+    await websocket.receive_text()
+    await websocket.close()
+    await websocket.send_text(messages.PARTNER_DISCONNECTED)  # после закрытия не пишется
+    recorder.close()
+
+    events = load_capture(path)[1]
+    assert [kind for _, kind, _ in events] == ["c", "o", "i", "x"]
+    assert events[1][2] == messages.waiting(1)
+    assert all(a[0] <= b[0] for a, b in zip(events, events[1:]))
+
+
+@pytest.mark.asyncio
+async def test_replay_reports_missing_unexpected_and_slow_frames(tmp_path):
+    """Тестируем воспроизведение записи против локального сервера и код выхода"""
+    import websockets
+    from backend.tools.replay import main as replay_main, replay
+
+    async def handler(websocket):
+        # Отвечаем на каждый кадр "<type>_ack" с заданной задержкой и числом ответов
+        async for message in websocket:
+            data = json.loads(message)
+            await asyncio.sleep(data.get("delay", 0))
+            for _ in range(data.get("replies", 1)):
+                await websocket.send(json.dumps({"type": f"{data['type']}_ack"}))
+
+    def write_capture(name, events):
+        path = tmp_path / name
+        path.write_text("".join(json.dumps(event) + "\n" for event in events))
+        return str(path)
+
+    hello, hello_ack = json.dumps({"type": "hello"}), json.dumps({"type": "hello_ack"})
+    clean = [
+        [0.0, 1, "c", hello], [0.0, 1, "o", hello_ack],
+        [0.1, 1, "i", json.dumps({"type": "ping", "replies": 2})], [0.1, 1, "o", json.dumps({"type": "ping_ack"})],
+        [0.2, 1, "x", None],
+    ]
+    full = write_capture("full.jsonl", clean + [
+        # Записан ответ, которого сервер больше не присылает
+        [0.0, 2, "c", hello], [0.0, 2, "o", hello_ack], [0.0, 2, "o", json.dumps({"type": "match_found"})],
+        # Сервер отвечает на 150 мс позже, чем в записи
+        [0.0, 3, "c", json.dumps({"type": "slow", "delay": 0.15})], [0.0, 3, "o", json.dumps({"type": "slow_ack"})],
+    ])
+    clean = write_capture("clean.jsonl", clean)
+
+    async with websockets.serve(handler, "127.0.0.1", 0) as server:
+        url = f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        report = await replay(full, url, speed=1.0, grace=0.3)
+        assert report.errors == []
+        assert report.connections == 3
+        assert [timing.frame_type for timing in report.timings if timing.actual is None] == ["match_found"]
+        assert report.missing_frames == 1
+        assert report.unexpected_frames == 1  # второй ping_ack
+        assert report.regressions(0.1) == ["slow_ack"]
+        assert report.lag_percentiles("slow_ack")["p95"] >= 0.15
+
+        # main() сам запускает event loop, поэтому вызываем его из другого потока
+        async def exit_code(*argv):
+            with pytest.raises(SystemExit) as exc_info:
+                await asyncio.to_thread(replay_main, [*argv, "--url", url, "--grace", "0.3", "--threshold-ms", "100"])
+            return exc_info.value.code
+
+        assert await exit_code(clean) == 0
+        assert await exit_code(full) == 1
+        assert await exit_code(clean, "--speed", "0") == 2
+        assert await exit_code(clean, "--speed", "-2") == 2
+
+    with pytest.raises(ValueError, match="speed"):
+        await replay(clean, url, speed=0)
+
+
+def test_server_config_from_env():
+    """Тестируем чтение типизированной конфигурации из окружения"""
+    from backend.utils.config import ServerConfig
+
+    config = ServerConfig.from_env({
+        "API_PORT": "9000",
+        "DEBUG": "True",
+        "WORKERS": "4",
+        "INACTIVITY_TIMEOUT": "45",
+        "BRIDGE_SNAPSHOT_PATH": "",
+    })
+    assert config.port == 9000
+    assert config.debug is True
+    assert config.workers == 4
+    assert config.inactivity_timeout == 45.0
+    assert config.snapshot_path is None
+    assert ServerConfig.from_env({}) == ServerConfig()
+
+    with pytest.raises(ValueError, match="API_PORT"):
+        ServerConfig.from_env({"API_PORT": "http"})
+    with pytest.raises(ValueError, match="HEARTBEAT_INTERVAL"):
+        ServerConfig.from_env({"HEARTBEAT_INTERVAL": "40"})
+    # Ошибки ловим при загрузке, а не посреди дренажа
+    for name, value in (("DRAIN_BATCH_SIZE", "0"), ("RECONNECT_JITTER", "-1"), ("DRAIN_BATCH_INTERVAL", "-0.5"),
+                        ("WS_MAX_SIZE", "-1"), ("WS_MAX_QUEUE", "0"), ("WS_PING_TIMEOUT", "0")):
+        with pytest.raises(ValueError, match=name):
+            ServerConfig.from_env({name: value})
+    assert ServerConfig.from_env({"RECONNECT_JITTER": "0", "DRAIN_BATCH_INTERVAL": "0"}).reconnect_jitter == 0
+
+
+@pytest.mark.asyncio
+async def test_server_drains_before_closing_connections():
+    """Тестируем, что при остановке дренаж выполняется до закрытия соединений uvicorn"""
+    import uvicorn
+    from backend.utils.server import DrainingServer
+
+    events = []
+
+    class FakeConnection:
+        def shutdown(self):
+            events.append("connection closed")
+            server.server_state.connections.discard(self)
+
+    class FakeLifespan:
+        async def shutdown(self):
+            events.append("lifespan shutdown")
+
+    async def drain():
+        await asyncio.sleep(0.01)
+        events.append("drained")
+
+    # servers, server_state и lifespan - внутренние атрибуты uvicorn.Server:
+    # тест привязан к закрепленной в requirements.txt версии uvicorn (0.24)
+    server = DrainingServer(uvicorn.Config(app=None), before_shutdown=drain)
+    server.servers = []
+    server.lifespan = FakeLifespan()
+    server.server_state.connections.add(FakeConnection())
+    await server.shutdown()
+
+    assert events == ["drained", "connection closed", "lifespan shutdown"]
+
+
+@pytest.mark.asyncio
+async def test_inactivity_timeout_is_configurable():
+    """Тестируем настраиваемый таймаут неактивности"""
+    now = [0.0]
+    manager = ConnectionManager(clock=lambda: now[0], inactivity_timeout=10)
+    closed = []
+
+    class ClosingWebSocket(MockWebSocket):
+        async def close(self, code=1000):
+            closed.append(code)
+
+    await manager.connect(ClosingWebSocket(), "user1", {"user_id": "user1", "country": "Russia"})
+
+    now[0] = 9
+    await manager.cleanup_inactive_connections()
+    assert "user1" in manager.active_connections
+
+    now[0] = 11
+    await manager.cleanup_inactive_connections()
+    assert "user1" not in manager.active_connections
+    # Обработчик соединения ждет кадр без таймаута, поэтому сокет закрывает менеджер
+    assert closed == [1000]
+
+
+@pytest.mark.asyncio
+async def test_cleanup_flushes_batches_before_partner_notice(monkeypatch):
+    """Тестируем, что при очистке неактивных склеенные сообщения приходят раньше partner_disconnected"""
+    from backend.utils.batching import ChatBatcher
+
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+    import main
+
+    now = [0.0]
+    manager = ConnectionManager(clock=lambda: now[0], inactivity_timeout=10)
+    received = []
+
+    class RecordingWebSocket(MockWebSocket):
+        def __init__(self, user_id):
+            self.user_id = user_id
+
+        async def send_text(self, message):
+            received.append((self.user_id, json.loads(message)["type"]))
+
+    for user_id in ("alice", "bob"):
+        await manager.connect(RecordingWebSocket(user_id), user_id, {"user_id": user_id, "country": "Russia"})
+    assert manager.pair_users("alice", "bob")
+
+    batcher = ChatBatcher(manager.send_personal_message, delay=60, max_messages=32)
+    monkeypatch.setattr(main, "batcher", batcher)
+    for text in ("one", "two"):
+        await batcher.submit(messages.chat_message(text, "alice"), "bob")
+    await batcher.submit(messages.chat_message("late", "bob"), "alice")
+    assert batcher.pending_count("bob") == 1 and batcher.pending_count("alice") == 0
+
+    # alice молчит, bob шлет heartbeat
+    now[0] = 11
+    manager.update_activity("bob")
+    await manager.cleanup_inactive_connections(before_notify=main.flush_before_cleanup)
+
+    bob_frames = [frame_type for user_id, frame_type in received if user_id == "bob"]
+    assert bob_frames == ["chat_message", "chat_message", "partner_disconnected"]
+    assert batcher.pending_count("bob") == 0
+
+
+def test_latency_histogram():
+    """Тестируем гистограмму задержек"""
+    from backend.utils.latency import LatencyHistogram
+
+    histogram = LatencyHistogram()
+    for ms in range(1, 101):
+        histogram.record(ms / 1000)
+    histogram.record(-0.005)  # часы клиента спешат
+
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 101
+    assert snapshot["negative"] == 1
+    assert snapshot["min_ms"] == 0
+    assert snapshot["max_ms"] == 100
+    assert 25 <= snapshot["p50_ms"] <= 100
+    assert snapshot["p50_ms"] <= snapshot["p95_ms"] <= snapshot["p99_ms"] <= 100
+
+
+def test_chat_message_tracing_end_to_end():
+    """Тестируем метки seq/времени и ack через настоящий /ws"""
+    from fastapi.testclient import TestClient
+
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+    import main
+
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/ws") as sender, client.websocket_connect("/ws") as receiver:
+            sender.send_json({"country": "Russia", "language": "ru"})
+            assert sender.receive_json()["type"] == "connection_established"
+            assert sender.receive_json()["type"] == "waiting"
+            receiver.send_json({"country": "USA", "language": "en"})
+            assert receiver.receive_json()["type"] == "connection_established"
+            assert receiver.receive_json()["type"] == "match_found"
+            assert sender.receive_json()["type"] == "match_found"
+
+            client_ts = time.time()
+            sender.send_json({"type": "chat_message", "text": "hi", "seq": 7, "client_ts": client_ts})
+            forwarded = receiver.receive_json()
+            assert forwarded["seq"] == 7
+            assert forwarded["client_ts"] == client_ts
+            assert client_ts <= forwarded["server_recv_ts"] <= forwarded["server_send_ts"]
+
+            receiver.send_json({
+                "type": "chat_ack",
+                "seq": 7,
+                "server_recv_ts": forwarded["server_recv_ts"],
+                "server_send_ts": forwarded["server_send_ts"],
+                "client_recv_ts": time.time()
+            })
+            ack = sender.receive_json()
+            assert ack["type"] == "chat_ack"
+            assert ack["seq"] == 7
+
+            # Сообщения без seq пересылаются в прежнем формате
+            sender.send_json({"type": "chat_message", "text": "plain"})
+            assert set(receiver.receive_json()) == {"type", "text", "from_user"}
+
+        # Оба пользователя (в том числе пришедший через очередь ожидания) удалены из менеджера;
+        # серверная сторона обрабатывает закрытие асинхронно, поэтому немного ждем
+        deadline = time.time() + 2
+        while main.manager.active_connections and time.time() < deadline:
+            time.sleep(0.01)
+        assert len(main.manager.active_connections) == 0
+        assert main.manager.get_waiting_queue_size() == 0
+
+        stats = client.get("/stats/latency").json()
+        for hop in ("client_to_server", "server_queue", "server_to_client", "delivery_roundtrip"):
+            assert stats[hop]["count"] == 1
+
+
+def test_non_finite_trace_timestamps_are_ignored():
+    """Тестируем, что NaN, Infinity и нереальные метки времени не попадают ни партнеру, ни в гистограммы"""
+    from fastapi.testclient import TestClient
+
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+    import main
+
+    def counts():
+        return {hop: histogram.count for hop, histogram in main.latency.hops.items()}
+
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/ws") as sender, client.websocket_connect("/ws") as receiver:
+            sender.send_json({"country": "Russia", "language": "ru"})
+            sender.receive_json(), sender.receive_json()
+            receiver.send_json({"country": "USA", "language": "en"})
+            receiver.receive_json(), receiver.receive_json()
+            sender.receive_json()
+            before = counts()
+
+            # json.loads на сервере принимает NaN и Infinity, поэтому шлем сырой текст
+            for client_ts in ("NaN", "Infinity", "-Infinity", "1e308", "0"):
+                sender.send_text(f'{{"type": "chat_message", "text": "hi", "seq": 1, "client_ts": {client_ts}}}')
+                # parse_constant срабатывает только на NaN/Infinity - в корректном JSON их нет
+                forwarded = json.loads(receiver.receive_text(), parse_constant=pytest.fail)
+                assert set(forwarded) == {"type", "text", "from_user"}
+
+            now = time.time()
+            for server_send_ts in ("NaN", "Infinity", str(now + 100), str(now - 10 ** 6)):
+                receiver.send_text(
+                    f'{{"type": "chat_ack", "seq": 1, "server_recv_ts": {now - 1}, '
+                    f'"server_send_ts": {server_send_ts}, "client_recv_ts": {now}}}')
+            # Корректное подтверждение после мусорных доходит, значит, мусорные отброшены, а не зависли
+            receiver.send_json({"type": "chat_ack", "seq": 2, "server_recv_ts": now - 1,
+                                "server_send_ts": now - 0.5, "client_recv_ts": now})
+            assert sender.receive_json()["seq"] == 2
+
+        after = counts()
+        assert after.get("client_to_server", 0) == before.get("client_to_server", 0)
+        assert after["delivery_roundtrip"] == before.get("delivery_roundtrip", 0) + 1
+        response = client.get("/stats/latency")
+        assert response.status_code == 200
+
+
+def test_admin_drain_requires_secret_key(monkeypatch):
+    """Тестируем, что /admin/drain без настоящего SECRET_KEY выключен"""
+    import dataclasses
+    from fastapi.testclient import TestClient
+
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+    import main
+
+    started = []
+
+    class FakeDrainTask:
+        def done(self):
+            return False
+
+    def fake_ensure_drain():
+        started.append(True)
+        return FakeDrainTask()
+
+    # Настоящий дренаж необратим для общего менеджера, поэтому подменяем его запуск
+    monkeypatch.setattr(main, "ensure_drain", fake_ensure_drain)
+
+    with TestClient(main.app) as client:
+        for secret_key in (None, "", "your-secret-key-here"):
+            monkeypatch.setattr(main, "config", dataclasses.replace(main.config, secret_key=secret_key))
+            assert client.post("/admin/drain", headers={"X-Admin-Token": "your-secret-key-here"}).status_code == 403
+            assert client.post("/admin/drain").status_code == 403
+
+        monkeypatch.setattr(main, "config", dataclasses.replace(main.config, secret_key="s3cret"))
+        assert client.post("/admin/drain", headers={"X-Admin-Token": "wrong"}).status_code == 403
+        assert not started
+        assert client.post("/admin/drain", headers={"X-Admin-Token": "s3cret"}).status_code == 200
+        assert started == [True]
+    assert not main.manager.draining
+
+
+def test_traffic_recorder_starts_per_worker(monkeypatch, tmp_path):
+    """Тестируем, что запись трафика запускается в lifespan и пишет в файл своего воркера"""
+    import dataclasses
+    from fastapi.testclient import TestClient
+
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+    import main
+
+    # При импорте поток записи не создается: после fork он остался бы только у родителя
+    assert main.recorder is None
+    monkeypatch.setattr(main, "config", dataclasses.replace(main.config, capture_path=str(tmp_path / "capture.jsonl")))
+    monkeypatch.setenv("BRIDGE_WORKER", "2")
+    monkeypatch.setattr(main.manager, "worker", None)
+    with TestClient(main.app):
+        assert main.recorder is not None
+        assert main.recorder.path == str(tmp_path / "capture.2.jsonl")
+    assert main.recorder is None
+    assert os.listdir(tmp_path) == ["capture.2.jsonl"]
+
+
+def test_handshake_after_drain_started_is_redirected(monkeypatch):
+    """Тестируем, что клиент, приславший первый кадр уже во время дренажа, не остается на узле"""
+    from fastapi.testclient import TestClient
+    from starlette.websockets import WebSocketDisconnect
+
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+    import main
+
+    # monkeypatch вернет менеджер в обычный режим после теста
+    monkeypatch.setattr(main.manager, "draining", False)
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/ws") as websocket:
+            main.manager.start_drain()
+            websocket.send_json({"country": "Russia", "language": "ru"})
+            hint = websocket.receive_json()
+            assert hint["type"] == "server_draining"
+            assert 0 <= hint["reconnect_after"] <= main.config.reconnect_jitter
+            with pytest.raises(WebSocketDisconnect) as closed:
+                websocket.receive_json()
+            assert closed.value.code == 1012
+        assert len(main.manager.active_connections) == 0
+
+
+def test_memory_benchmark_counts_idle_connections():
+    """Тестируем замер памяти на соединение"""
+    from backend.tools.memory_benchmark import measure
+
+    result = measure(2000, paired_fraction=0.5)
+    assert result.waiting == 1000
+    assert result.paired == 1000
+    # Компактная запись сессии: сотни байт, а не килобайты на соединение
+    assert 0 < result.bytes_per_connection < 1000
+
+
+@pytest.mark.asyncio
+async def test_chat_batcher_coalesces_bursts():
+    """Тестируем склейку быстрых сообщений одному получателю в chat_batch"""
+    from backend.utils.batching import ChatBatcher
+    from backend.utils.config import ServerConfig
+
+    sent = []
+
+    async def send(frame, user_id):
+        sent.append((user_id, json.loads(frame)))
+
+    batcher = ChatBatcher(send, delay=0.01, max_messages=3)
+
+    # Первое сообщение после паузы уходит сразу, следующие копятся
+    for text in ("one", "two", "three"):
+        await batcher.submit(messages.chat_message(text, "alice"), "bob")
+    assert [frame["text"] for _, frame in sent] == ["one"]
+    assert batcher.pending_count("bob") == 2
+
+    await asyncio.sleep(0.03)
+    assert len(sent) == 2
+    user_id, batch = sent[1]
+    assert user_id == "bob"
+    assert batch["type"] == "chat_batch"
+    assert [message["text"] for message in batch["messages"]] == ["two", "three"]
+
+    # После паузы снова сразу, а полная пачка уходит, не дожидаясь окна
+    for text in ("four", "five", "six", "seven"):
+        await batcher.submit(messages.chat_message(text, "alice"), "bob")
+    assert sent[2][1]["text"] == "four"
+    assert [message["text"] for message in sent[3][1]["messages"]] == ["five", "six", "seven"]
+    batcher.forget("bob")
+    assert batcher.pending_count("bob") == 0
+
+    # Кадр-функция собирается в момент отправки пачки, а не в момент submit
+    rendered_at = []
+
+    def traced_frame():
+        rendered_at.append(time.monotonic())
+        return messages.chat_message("traced", "alice")
+
+    await batcher.submit(messages.chat_message("eight", "alice"), "bob")
+    submitted_at = time.monotonic()
+    await batcher.submit(traced_frame, "bob")
+    assert rendered_at == []
+    await asyncio.sleep(0.03)
+    assert rendered_at[0] - submitted_at >= 0.005
+    assert sent[-1][1]["text"] == "traced"
+
+    # Перед дренажом накопленное уходит, а новые сообщения больше не ждут
+    await batcher.submit(messages.chat_message("nine", "alice"), "bob")
+    await batcher.submit(messages.chat_message("ten", "alice"), "bob")
+    await batcher.close()
+    await batcher.submit(messages.chat_message("eleven", "alice"), "bob")
+    assert [frame["text"] for _, frame in sent[-3:]] == ["nine", "ten", "eleven"]
+    assert batcher.pending_count("bob") == 0
+
+    # Задержка ограничена, чтобы склейка не была заметна в живом чате
+    assert ServerConfig.from_env({"CHAT_BATCH_DELAY": "0.005"}).chat_batch_delay == 0.005
+    with pytest.raises(ValueError, match="CHAT_BATCH_DELAY"):
+        ServerConfig.from_env({"CHAT_BATCH_DELAY": "0.5"})
+
+
+@pytest.mark.asyncio
+async def test_handshake_normalizes_country_and_language(manager):
+    """Тестируем приведение страны и языка к каноническим ID и отказ на некорректных данных"""
+    from backend.utils.handshake import HandshakeError, parse_handshake
+
+    usa = parse_handshake('{"country": " usa ", "language": "EN-us"}')
+    assert usa["country"] == "USA" and usa["language"] == "en"
+    assert parse_handshake('{"country": "United  States", "language": "English"}')["country_id"] == usa["country_id"]
+    assert isinstance(usa["country_id"], int)
+
+    for bad in ('not json', '[]', '{}', '{"country": 5}', '{"country": "<b>"}',
+                '{"country": "USA", "language": ["en"]}', '{"country": "USA", "batching": "yes"}',
+                '{"country": "Atlantis"}', '{"country": "USA", "language": "klingon"}'):
+        with pytest.raises(HandshakeError):
+            parse_handshake(bad)
+
+    # Выдуманные названия отклоняются и не занимают место в таблице: реальные страны
+    # (в том числе вне прежнего короткого списка) по-прежнему принимаются
+    for i in range(1100):
+        with pytest.raises(HandshakeError, match="Unknown country"):
+            parse_handshake(json.dumps({"country": f"zz{i:04d}x"}))
+    for country, canonical in (("Italy", "Italy"), ("es", "Spain"), ("IND", "India"), ("turkey", "Türkiye")):
+        assert parse_handshake(json.dumps({"country": country}))["country"] == canonical
+    assert parse_handshake('{"country": "China", "language": "zh-Hant"}')["language"] == "zh"
+
+    # Разные написания одной страны больше не подбираются друг другу
+    user1 = {"user_id": "user1", "country": "USA", "language": "en"}
+    user2 = {"user_id": "user2", "country": "usa", "language": "en"}
+    await manager.connect(MockWebSocket(), "user1", user1)
+    await manager.connect(MockWebSocket(), "user2", user2)
+    assert await manager.find_partner(user1) is None
+    assert await manager.find_partner(user2) is None
+    assert manager.get_waiting_queue_size() == 2
+
+
+def test_malformed_handshake_is_rejected_before_connecting():
+    """Тестируем, что некорректный первый кадр отклоняется без заведения сессии"""
+    from fastapi.testclient import TestClient
+    from starlette.websockets import WebSocketDisconnect
+
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+    import main
+
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/ws") as websocket:
+            websocket.send_text('{"country": 42}')
+            assert websocket.receive_json() == {"type": "error", "message": "country is required"}
+            with pytest.raises(WebSocketDisconnect) as closed:
+                websocket.receive_json()
+            assert closed.value.code == 1008
+        assert len(main.manager.active_connections) == 0
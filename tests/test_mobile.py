@@ -0,0 +1,166 @@
+import sys
+import os
+
+# Добавляем путь к mobile
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from mobile.async_client import BridgeClient
+
+
+def test_messages_are_batched_per_frame():
+    """Тестируем, что сообщения уходят в UI одной пачкой за кадр"""
+    batches = []
+    client = BridgeClient()
+    client.set_callbacks(batches.append, lambda status: None)
+
+    client._show_message("Partner: one")
+    client._show_message("Partner: two")
+    client._show_message("Partner: three")
+    assert batches == []
+
+    client._flush_messages(0)
+    assert batches == [["Partner: one", "Partner: two", "Partner: three"]]
+
+    # Пустой кадр не вызывает обновление интерфейса
+    client._flush_messages(0)
+    assert len(batches) == 1
+
+
+def test_chat_batch_is_unpacked_and_acked():
+    """Тестируем разбор chat_batch: сообщения по порядку, ack на каждое"""
+    import asyncio
+    import json
+
+    sent = []
+
+    class FakeWebSocket:
+        async def send(self, frame):
+            sent.append(json.loads(frame))
+
+    batches = []
+    client = BridgeClient()
+    client.set_callbacks(batches.append, lambda status: None)
+    client.user_id = "me"
+    client.websocket = FakeWebSocket()
+
+    batch = {"type": "chat_batch", "messages": [
+        {"type": "chat_message", "text": "one", "from_user": "partner",
+         "seq": 1, "client_ts": 1.0, "server_recv_ts": 2.0, "server_send_ts": 3.0},
+        {"type": "chat_message", "text": "two", "from_user": "partner"},
+    ]}
+    asyncio.run(client._handle_message(json.dumps(batch)))
+
+    client._flush_messages(0)
+    assert batches == [["Partner: one", "Partner: two"]]
+    assert [(ack["type"], ack["seq"]) for ack in sent] == [("chat_ack", 1)]
+
+
+def test_reconnect_keeps_single_heartbeat():
+    """Тестируем, что после переподключения по server_draining работает один цикл heartbeat"""
+    import asyncio
+    import json
+
+    heartbeat_tasks = []
+
+    class FakeWebSocket:
+        def __init__(self, frames):
+            self.frames = frames
+            self.sent = []
+
+        async def send(self, frame):
+            self.sent.append(json.loads(frame))
+
+        async def close(self):
+            pass
+
+        async def __aiter__(self):
+            for frame in self.frames:
+                yield json.dumps(frame)
+            # Даем heartbeat сработать несколько раз на этом соединении
+            await asyncio.sleep(0.05)
+            heartbeat_tasks.append(len([
+                task for task in asyncio.all_tasks()
+                if task.get_coro().__name__ == "_heartbeat" and not task.done()
+            ]))
+
+    first = FakeWebSocket([
+        {"type": "connection_established", "user_id": "me", "heartbeat_interval": 0.01, "resume_token": "t1"},
+        {"type": "server_draining", "reconnect_after": 0},
+    ])
+    second = FakeWebSocket([])
+    sockets = iter([first, second])
+
+    client = BridgeClient()
+    client.set_callbacks(lambda messages: None, lambda status: None)
+
+    async def open_websocket():
+        return next(sockets)
+
+    client._open_websocket = open_websocket
+
+    async def run():
+        await client.connect("Russia", "ru")
+        await client.disconnect()
+
+    asyncio.run(run())
+
+    assert heartbeat_tasks == [1, 1]
+    assert second.sent[0]["resume_token"] == "t1"
+
+
+def test_cold_start_defers_heavy_imports():
+    """Тестируем, что импорт приложения не тянет websockets и виджеты Kivy"""
+    import json
+    import subprocess
+
+    heavy = ["websockets", "kivy.uix.boxlayout", "kivy.uix.button", "kivy.uix.label",
+             "kivy.uix.textinput", "kivy.uix.spinner", "kivy.core.window"]
+    # Отдельный процесс: в этом sys.modules уже заполнен другими тестами
+    code = (
+        "import json, sys\n"
+        "import mobile.main, mobile.async_client\n"
+        f"print(json.dumps([name for name in {heavy!r} if name in sys.modules]))\n"
+    )
+    env = dict(os.environ, KIVY_NO_ARGS="1", KIVY_NO_CONSOLELOG="1")
+    root = os.path.join(os.path.dirname(__file__), '..')
+    result = subprocess.run([sys.executable, "-c", code], cwd=root, env=env,
+                            capture_output=True, text=True, timeout=120, check=True)
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+
+
+def test_prewarmed_connection_is_reused_only_while_open(monkeypatch):
+    """Тестируем, что заранее открытое соединение берется, только если оно еще живо"""
+    import asyncio
+    import websockets
+
+    class FakeWebSocket:
+        def __init__(self, is_open):
+            self.open = is_open
+
+    class FakeTimer:
+        cancelled = False
+
+        def cancel(self):
+            self.cancelled = True
+
+    fresh = FakeWebSocket(True)
+    opened = []
+
+    async def fake_connect(url, **kwargs):
+        opened.append(url)
+        return fresh
+
+    monkeypatch.setattr(websockets, "connect", fake_connect)
+    client = BridgeClient()
+
+    prewarmed, timer = FakeWebSocket(True), FakeTimer()
+    client._prewarmed, client._prewarm_expiry = prewarmed, timer
+    assert asyncio.run(client._open_websocket()) is prewarmed
+    assert timer.cancelled and client._prewarmed is None and client._prewarm_expiry is None
+    assert opened == []
+
+    # Сервер успел закрыть соединение - открываем новое
+    client._prewarmed = FakeWebSocket(False)
+    assert asyncio.run(client._open_websocket()) is fresh
+    assert client._prewarmed is None
+    assert len(opened) == 1